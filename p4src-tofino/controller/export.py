@@ -0,0 +1,93 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+
+import struct
+import zlib
+import numpy as np
+
+# Binary export of the inactive space, all integers big-endian:
+#   header  magic 'MRP4', version (u8), flags (u8), reserved (u16),
+#           sweep generation (u64), number of runs (u32)
+#   body    one (first address, number of addresses) u32 pair per run of
+#           dark addresses, sorted and with touching runs merged;
+#           zlib-compressed when flags has FLAG_ZLIB
+MAGIC = b'MRP4'
+VERSION = 1
+FLAG_ZLIB = 1
+HEADER = struct.Struct('>4sBBHQI')
+COMPRESSIONS = ('none', 'zlib')
+
+
+def merged_runs(runs):
+    # (starts, ends) address array pairs of all blocks as one sorted pair of
+    # arrays, with runs that touch across block boundaries merged
+    runs = list(runs)
+    if not runs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.concatenate([r[0] for r in runs]).astype(np.int64)
+    ends = np.concatenate([r[1] for r in runs]).astype(np.int64)
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    if not len(starts):
+        return starts, ends
+    keep = np.concatenate(([True], starts[1:] != ends[:-1]))
+    return starts[keep], ends[np.concatenate((keep[1:], [True]))]
+
+
+def encode_runs(runs, generation, compression='none'):
+    starts, ends = merged_runs(runs)
+    body = np.column_stack((starts, ends - starts)).astype('>u4').tobytes()
+    flags = 0
+    if compression == 'zlib':
+        body = zlib.compress(body)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, 0, generation, len(starts)) + body
+
+
+def decode_runs(payload):
+    # returns (generation, starts, ends) with [start, end) address runs
+    if len(payload) < HEADER.size:
+        raise ValueError('Export payload is shorter than its header')
+    magic, version, flags, _, generation, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'Not a version {VERSION} export payload')
+    body = payload[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if len(body) != count * 8:
+        raise ValueError(f'Export payload holds {len(body)} bytes for {count} runs')
+    pairs = np.frombuffer(body, dtype='>u4').reshape(count, 2).astype(np.int64)
+    return generation, pairs[:, 0], pairs[:, 0] + pairs[:, 1]
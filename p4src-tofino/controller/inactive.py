@@ -0,0 +1,224 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import ipaddress
+import secrets
+import socket
+import threading
+from collections import OrderedDict
+import numpy as np
+from prefixes import cidr_cover, overlapping
+from export import encode_runs
+from changes import ChangeJournal, address_cover
+from status import lookup
+
+
+class InactiveSnapshot:
+    # Dark runs of every monitored block for one sweep generation, with the
+    # counters and block layout they came from. Never modified once
+    # published; only the memoized answers are filled in.
+    def __init__(self, generation, runs, lru_size, epoch='', values=None, layout=None, alpha=1):
+        self.generation = generation
+        self.runs = runs      # base_idx -> (starts, ends) address arrays
+        self.values = np.empty(0, dtype=np.uint8) if values is None else values
+        self.layout = layout or (np.empty(0, dtype=np.int64),) * 3
+        self.alpha = alpha
+        self.lru_size = lru_size
+        # the epoch keeps generations of different runs of the controller apart
+        self.epoch = epoch
+        self.etag = f'{epoch}-{generation}'
+        self.full = None
+        self.lru = OrderedDict()
+        self.starts_lru = OrderedDict()
+        self.exports = dict()
+        self.lru_lock = threading.Lock()
+
+    def get(self, covering_prefix=None):
+        if covering_prefix is None:
+            if self.full is None:
+                self.full = cover(self.runs.values())
+            return self.full
+
+        net = ipaddress.IPv4Network(covering_prefix, strict=False)
+        key = str(net)
+        with self.lru_lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                return self.lru[key]
+
+        # only the blocks that overlap the prefix are clipped
+        low = int(net.network_address)
+        high = low + net.num_addresses
+        first, last = overlapping(self.layout, low, high)
+        clipped = []
+        for base_idx in self.layout[1][first:last].tolist():
+            starts, ends = self.runs[base_idx]
+            starts, ends = np.maximum(starts, low), np.minimum(ends, high)
+            keep = starts < ends
+            clipped.append((starts[keep], ends[keep]))
+        result = cover(clipped)
+
+        with self.lru_lock:
+            self.lru[key] = result
+            if len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+        return result
+
+    def export(self, compression='none'):
+        # binary export of all dark runs, encoded once per compression
+        with self.lru_lock:
+            if compression not in self.exports:
+                self.exports[compression] = encode_runs(self.runs.values(), self.generation, compression)
+            return self.exports[compression]
+
+    def starts(self, covering_prefix=None):
+        # start addresses of get(covering_prefix), for cursor lookups
+        key = None if covering_prefix is None else str(ipaddress.IPv4Network(covering_prefix, strict=False))
+        with self.lru_lock:
+            if key in self.starts_lru:
+                self.starts_lru.move_to_end(key)
+                return self.starts_lru[key]
+        # inet_aton is much faster than ipaddress on long lists
+        starts = np.array([int.from_bytes(socket.inet_aton(prefix.split('/')[0]), 'big')
+                           for prefix in self.get(covering_prefix)], dtype=np.int64)
+        with self.lru_lock:
+            self.starts_lru[key] = starts
+            if len(self.starts_lru) > self.lru_size:
+                self.starts_lru.popitem(last=False)
+        return starts
+
+    def page(self, covering_prefix=None, cursor=None, limit=None):
+        # at most limit prefixes starting after the cursor address; returns
+        # them and the cursor of the next page, None on the last one. The
+        # cursor is an address, so it stays valid across generations.
+        prefixes = self.get(covering_prefix)
+        first = 0
+        if cursor is not None:
+            first = int(np.searchsorted(self.starts(covering_prefix), int(ipaddress.IPv4Address(cursor)), side='right'))
+        last = len(prefixes) if limit is None else min(first + limit, len(prefixes))
+        next_cursor = prefixes[last - 1].split('/')[0] if last < len(prefixes) else None
+        return prefixes[first:last], next_cursor
+
+    def status(self, items):
+        # state of each address or prefix in items (see status.py)
+        return lookup(self.layout, self.values, self.alpha, items)
+
+
+class InactiveCache:
+    # Aggregated inactive space, maintained per monitored block and stamped
+    # with the sweep generation. A sweep only recomputes the dark runs of the
+    # blocks it changed and publishes a new InactiveSnapshot with a single
+    # assignment; readers take self.snapshot once and never block the sweep.
+    def __init__(self, mapping, counters, lru_size=128):
+        self.mapping = mapping
+        self.counters = counters
+        self.lru_size = lru_size
+        self.epoch = secrets.token_hex(4)
+        self.snapshot = InactiveSnapshot(0, dict(), lru_size, self.epoch)
+        self.journal = ChangeJournal()
+        # called without arguments after every published generation
+        self.listeners = []
+
+    @property
+    def generation(self):
+        return self.snapshot.generation
+
+    def rebuild(self, generation=None):
+        # recompute every block, e.g. after the monitored layout changed;
+        # generation continues the numbering of a resumed state
+        values = self.counters.snapshot()
+        runs = {base_idx: self._block_runs(values, base_idx, network, length)
+                for base_idx, network, length in self.mapping.blocks}
+        self._publish(runs, values, generation)
+        self.journal.reset(self.generation)
+        self._notify()
+
+    def update(self, activated, deactivated):
+        # refresh the blocks holding the indices that became active or dark
+        # and journal their addresses under the new generation
+        values = self.counters.snapshot()
+        activated = np.asarray(activated, dtype=np.int64)
+        deactivated = np.asarray(deactivated, dtype=np.int64)
+        changed = np.concatenate((activated, deactivated))
+        blocks = self.mapping.blocks
+        bases = np.array([b[0] for b in blocks], dtype=np.int64)
+        touched = np.unique(np.searchsorted(bases, changed, side='right') - 1) if len(changed) else []
+        runs = dict(self.snapshot.runs)
+        for pos in touched:
+            if pos >= 0:
+                runs[blocks[pos][0]] = self._block_runs(values, *blocks[pos])
+        # journaled first, so that a generation read from the snapshot
+        # always has its changes in the journal
+        self.journal.record(self.generation + 1, np.sort(self.mapping.addresses(activated)).astype(np.int64),
+                            np.sort(self.mapping.addresses(deactivated)).astype(np.int64))
+        self._publish(runs, values)
+        self._notify()
+
+    def changes(self, since, epoch=None):
+        # CIDRs that became active or dark after generation since; asks for a
+        # full resync when those changes are gone or came from another run
+        changes = self.journal.since(since) if epoch in (None, self.epoch) else None
+        if changes is None:
+            return {'epoch': self.epoch, 'generation': self.generation, 'resync': True}
+        generation, activated, deactivated = changes
+        return {'epoch': self.epoch, 'generation': generation, 'resync': False,
+                'activated': address_cover(activated), 'deactivated': address_cover(deactivated)}
+
+    def _publish(self, runs, values, generation=None):
+        if generation is None:
+            generation = self.snapshot.generation
+        self.snapshot = InactiveSnapshot(generation + 1, runs, self.lru_size, self.epoch,
+                                         values, self.mapping.layout(), self.counters.alpha)
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def _block_runs(self, values, base_idx, network, length):
+        starts, ends = self.counters.dark_runs(base_idx, base_idx + 2**(32 - length), values)
+        offset = network - base_idx
+        return starts + offset, ends + offset
+
+    def get(self, covering_prefix=None):
+        return self.snapshot.get(covering_prefix)
+
+
+def cover(runs):
+    # minimal CIDR cover of (starts, ends) address array pairs
+    runs = list(runs)
+    if not runs:
+        return []
+    starts = np.concatenate([r[0] for r in runs]).tolist()
+    ends = np.concatenate([r[1] for r in runs]).tolist()
+    return cidr_cover(zip(starts, ends))
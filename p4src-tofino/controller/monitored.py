@@ -0,0 +1,122 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+
+import ipaddress
+import logging
+
+from aggregate6 import aggregate
+
+# size of the monitored LPM table in darknet-norec.p4
+MONITORED_TABLE_SIZE = 1024
+
+
+def read_monitored(path):
+    # prefixes of a monitored file, without comments and blank lines
+    with open(path, 'r') as f:
+        return [line for line in (raw.strip() for raw in f) if line and not line.startswith('#')]
+
+
+def compile_monitored(entries, table_size=MONITORED_TABLE_SIZE, max_prefixlen=32):
+    # Normalize, deduplicate and aggregate monitored prefixes into the list
+    # that is programmed; returns (prefixes, footprint). Overlapping prefixes
+    # would count their shared addresses twice and are refused, adjacent ones
+    # are merged to save monitored table entries. Prefixes longer than
+    # max_prefixlen do not fit the target's register layout.
+    nets = []
+    for entry in entries:
+        try:
+            net = ipaddress.IPv4Network(entry)
+        except ValueError:
+            try:
+                net = ipaddress.IPv4Network(entry, strict=False)
+            except ValueError as e:
+                raise ValueError(f'Invalid monitored prefix {entry}: {e}')
+            logging.warning(f'Monitored prefix {entry} has host bits set, using {net}')
+        nets.append(net)
+    unique = sorted(set(nets))
+    too_long = [str(net) for net in unique if net.prefixlen > max_prefixlen]
+    if too_long:
+        raise ValueError(f'Monitored prefixes longer than /{max_prefixlen} are not supported: {", ".join(too_long)}')
+
+    # sorted by address and then length, a prefix overlaps another only if
+    # the last one not inside any other covers it
+    overlaps = []
+    outer = None
+    for net in unique:
+        if outer is not None and net.subnet_of(outer):
+            overlaps.append(f'{net} in {outer}')
+        else:
+            outer = net
+    if overlaps:
+        raise ValueError(f'Overlapping monitored prefixes: {", ".join(overlaps)}')
+
+    prefixes = aggregate([str(net) for net in unique])
+    if len(prefixes) > table_size:
+        raise ValueError(f'{len(prefixes)} monitored prefixes exceed the {table_size} entries of the monitored table')
+    aggregated = [ipaddress.IPv4Network(prefix) for prefix in prefixes]
+    footprint = {
+        'lines': len(nets),
+        'duplicates': len(nets) - len(unique),
+        'merged': len(unique) - len(prefixes),
+        'entries': len(prefixes),
+        'table_size': table_size,
+        'addresses': sum(net.num_addresses for net in aggregated),
+        'dark_meters': sum(2**max(24 - net.prefixlen, 0) for net in aggregated),
+    }
+    return prefixes, footprint
+
+
+def shared_range(old, new):
+    # (offset in old, offset in new, length) of the addresses two monitored
+    # blocks have in common, None if they are disjoint
+    if old.subnet_of(new):
+        return 0, int(old.network_address) - int(new.network_address), old.num_addresses
+    if new.subnet_of(old):
+        return int(new.network_address) - int(old.network_address), 0, new.num_addresses
+    return None
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    # check a monitored file offline: print the programmed prefixes and footprint
+    parser = ArgumentParser()
+    parser.add_argument('monitored', type=str, help='Monitored prefixes file.')
+    parser.add_argument('--max-prefixlen', default=32, type=int, help='Longest prefix the target supports (31 on Tofino2).')
+    args = parser.parse_args()
+    prefixes, footprint = compile_monitored(read_monitored(args.monitored), max_prefixlen=args.max_prefixlen)
+    print('\n'.join(prefixes))
+    print(', '.join(f'{key}: {value}' for key, value in footprint.items()))
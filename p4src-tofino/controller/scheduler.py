@@ -0,0 +1,131 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+OVERRUN_POLICIES = ('skip', 'catchup', 'split')
+MAX_PARTS = 16
+
+
+class PhaseTimer:
+    # Wall-clock time spent in each named phase of one sweep.
+    def __init__(self):
+        self.phases = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def __str__(self):
+        return ', '.join(f'{name} {secs:.3f}s' for name, secs in self.phases.items())
+
+
+class SweepScheduler:
+    # Runs sweeps on a fixed cadence. Deadlines are interval apart on the
+    # monotonic clock, so the period does not drift by the sweep duration
+    # and alpha keeps meaning the same detection latency under load.
+    # A sweep still running at its deadline is an overrun, handled by policy:
+    #   skip     drop the missed ticks and start again on the next one
+    #   catchup  start the next sweep right away (at most one tick behind)
+    #   split    spread each pass over more ticks, one part per tick, so
+    #            every address is still aged on a fixed (longer) period
+    def __init__(self, interval, policy='skip', max_parts=MAX_PARTS):
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f'overrun policy must be one of {OVERRUN_POLICIES}, got {policy}')
+        self.interval = interval
+        self.policy = policy
+        self.max_parts = max_parts
+        self.parts = 1
+        self.overruns = 0
+        self.last = None
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, sweep):
+        # sweep(timer, part, parts) is called once per tick until stop()
+        deadline = time.monotonic()
+        part = 0
+        pass_overrun = False
+        pass_time = 0.0
+        while not self.stopped.is_set():
+            timer = PhaseTimer()
+            started = time.monotonic()
+            sweep(timer, part, self.parts)
+            finished = time.monotonic()
+            self.last = timer
+            deadline += self.interval
+            pass_time = max(pass_time, finished - started)
+            logging.info(f'Sweep {part + 1}/{self.parts} took {finished - started:.3f} secs ({timer})')
+
+            # an interval of 0 runs sweeps back to back and cannot overrun
+            if self.interval > 0 and finished > deadline:
+                self.overruns += 1
+                pass_overrun = True
+                late = finished - deadline
+                logging.warning(f'Sweep overran its interval by {late:.3f} secs ({self.policy})')
+                if self.policy == 'catchup':
+                    deadline = max(deadline, finished - self.interval)
+                else:
+                    deadline += math.ceil(late / self.interval) * self.interval
+
+            part += 1
+            if part == self.parts:
+                # only regroup at pass boundaries so every address is swept once per pass
+                if self.policy == 'split':
+                    if pass_overrun and self.parts < self.max_parts:
+                        self.parts *= 2
+                        logging.warning(f'Splitting each sweep over {self.parts} intervals')
+                    elif not pass_overrun and self.parts > 1 and pass_time < self.interval / 4:
+                        self.parts //= 2
+                        logging.info(f'Splitting each sweep over {self.parts} intervals')
+                part = 0
+                pass_overrun = False
+                pass_time = 0.0
+
+            self.stopped.wait(max(deadline - time.monotonic(), 0))
@@ -0,0 +1,130 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+import logging
+import mmap
+import os
+import struct
+import numpy as np
+
+MAGIC = b'MORP4CNT'
+VERSION = 2
+# magic, version, dirty, generation, counters, blocks
+HEADER = struct.Struct('<8sIIQQQ')
+# base_idx, network, length of each monitored block, then the counters
+BLOCK = struct.Struct('<QII')
+
+
+class StateFile:
+    # Counter array and sweep generation in one memory-mapped file, with the
+    # blocks of the mapping they were saved for, so a restart that places the
+    # prefixes elsewhere (after a reload or compaction) still finds each
+    # prefix's counters. save() marks the file dirty while the counters are
+    # copied in, so a controller killed mid-save starts fresh instead of
+    # resuming half-written counters.
+    def __init__(self, path, mapping):
+        self.path = path
+        self.mapping = mapping
+        self._mmap = None
+
+    def open(self, values):
+        # map the file; copies the saved counters of the prefixes still
+        # monitored into values at their current base_idx and returns the
+        # generation they were saved at, or None if none could be resumed
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                return None
+            saved = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        with saved:
+            magic, version, dirty, generation, size, count = HEADER.unpack_from(saved)
+            if magic != MAGIC or version != VERSION or dirty or \
+                    len(saved) != HEADER.size + count * BLOCK.size + size:
+                logging.warning(f'Discarding state in {self.path}: not a complete state of this version')
+                return None
+            blocks = {(network, length): base_idx
+                      for base_idx, network, length in BLOCK.iter_unpack(saved[HEADER.size:HEADER.size + count * BLOCK.size])}
+            saved_values = np.frombuffer(saved, dtype=np.uint8, count=size, offset=HEADER.size + count * BLOCK.size)
+            resumed = 0
+            for base_idx, network, length in self.mapping.blocks:
+                saved_base_idx = blocks.pop((network, length), None)
+                if saved_base_idx is not None:
+                    n = 2**(32 - length)
+                    values[base_idx:base_idx + n] = saved_values[saved_base_idx:saved_base_idx + n]
+                    resumed += 1
+            del saved_values
+        if blocks:
+            logging.warning(f'Discarding the saved counters of {len(blocks)} prefixes in {self.path} '
+                            f'that are no longer monitored')
+        return generation if resumed else None
+
+    def save(self, values, generation):
+        blocks = list(self.mapping.blocks)
+        length = HEADER.size + len(blocks) * BLOCK.size + len(values)
+        if self._mmap is None or len(self._mmap) != length:
+            self._map(length)
+        self._write_header(1, generation, 0, 0)
+        offset = HEADER.size
+        for block in blocks:
+            BLOCK.pack_into(self._mmap, offset, *block)
+            offset += BLOCK.size
+        self._mmap[offset:] = np.ascontiguousarray(values, dtype=np.uint8).tobytes()
+        self._write_header(0, generation, len(values), len(blocks))
+        self._mmap.flush()
+
+    def _map(self, length):
+        # (re)map the file at a new length; only the header is kept valid
+        # across, and it is marked dirty before the resize
+        if self._mmap is not None:
+            self._write_header(1, 0, 0, 0)
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, length)
+            self._mmap = mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+
+    def _write_header(self, dirty, generation, size, count):
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, dirty, generation, size, count)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
@@ -0,0 +1,99 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+import contextlib
+import io
+import socket
+import threading
+import time
+import numpy as np
+from cli import CLI
+from counters import CounterStore
+from events import EventServer
+from inactive import InactiveCache
+from prefixes import PrefixMapping
+
+
+class Controller:
+    # the part of LocalClient the event server uses
+    def __init__(self):
+        mapping = PrefixMapping()
+        mapping.add('10.0.0.0/28', 0)
+        self.inactive_cache = InactiveCache(mapping, CounterStore(16, 1))
+        self.inactive_cache.rebuild()
+
+    def get_inactive_snapshot(self):
+        return self.inactive_cache.snapshot
+
+    def get_changes(self, since, epoch=None):
+        return self.inactive_cache.changes(since, epoch)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_watch_prints_each_event_before_the_next_sweep():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    controller = Controller()
+    events = EventServer(controller, '127.0.0.1', port)
+    events.start()
+    controller.inactive_cache.listeners.append(events.notify)
+
+    cli = CLI(events_port=port)
+    cli.addr = '127.0.0.1'
+    output = io.StringIO()
+    def watch():
+        with contextlib.redirect_stdout(output):
+            cli.do_watch('')
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        assert wait_for(lambda: events.subscribers)
+        for generation, index in ((2, 1), (3, 2)):
+            controller.inactive_cache.update(np.array([], dtype=np.int64), np.array([index]))
+            assert wait_for(lambda: f'Generation {generation}' in output.getvalue()), output.getvalue()
+        assert '- 10.0.0.1/32' in output.getvalue() and '- 10.0.0.2/32' in output.getvalue()
+    finally:
+        events.stop()
+        watcher.join(5)
+    assert not watcher.is_alive()
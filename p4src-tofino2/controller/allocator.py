@@ -0,0 +1,112 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+from bisect import insort
+
+
+class RangeAllocator:
+    # Free ranges of one register index space ([0, size)), kept sorted and
+    # merged on release. allocate() is best fit: the smallest free range
+    # that holds the block, so large holes stay available for large prefixes.
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.free_ranges = [(0, self.size)] if self.size else []   # (start, stop)
+
+    def allocate(self, length):
+        # start of a free [start, start+length), None if no range is large enough
+        best = None
+        for pos, (start, stop) in enumerate(self.free_ranges):
+            if stop - start >= length and (best is None or stop - start < self._length(best)):
+                best = pos
+        if best is None:
+            return None
+        start, stop = self.free_ranges[best]
+        if stop - start == length:
+            del self.free_ranges[best]
+        else:
+            self.free_ranges[best] = (start + length, stop)
+        return start
+
+    def release(self, start, length):
+        if not length:
+            return
+        insort(self.free_ranges, (start, start + length))
+        merged = []
+        for start, stop in self.free_ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        self.free_ranges = merged
+
+    def fits(self, lengths):
+        # whether every block can be placed, in the given order, without compaction
+        saved = list(self.free_ranges)
+        try:
+            return all(self.allocate(length) is not None for length in lengths)
+        finally:
+            self.free_ranges = saved
+
+    def compact(self, blocks):
+        # pack the live (start, length) blocks to the bottom, keeping their
+        # order; returns their new starts in the order given
+        starts = {}
+        next_start = 0
+        for start, length in sorted(blocks):
+            starts[start] = next_start
+            next_start += length
+        self.free_ranges = [(next_start, self.size)] if next_start < self.size else []
+        return [starts[start] for start, _ in blocks]
+
+    def _length(self, pos):
+        start, stop = self.free_ranges[pos]
+        return stop - start
+
+    @property
+    def free(self):
+        return sum(stop - start for start, stop in self.free_ranges)
+
+    @property
+    def largest_free(self):
+        return max((stop - start for start, stop in self.free_ranges), default=0)
+
+    def report(self):
+        used = self.size - self.free
+        return {'size': self.size, 'used': used, 'free': self.free,
+                'utilization': round(used / self.size, 4) if self.size else 0.0,
+                'largest_free': self.largest_free, 'free_ranges': len(self.free_ranges)}
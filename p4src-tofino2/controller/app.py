@@ -33,11 +33,13 @@
 # MODIFICATIONS.
 
 import netifaces as ni
+import ipaddress
 import json
 import socket
 import threading
 import requests
 import os
+import signal
 from flask import Flask, jsonify, request, Response, abort
 from flask_cors import CORS
 from controllertof import LocalClient
@@ -45,6 +47,9 @@ import logging
 from werkzeug.exceptions import HTTPException
 import time
 from argparse import ArgumentParser
+from serving import serve, stream_json
+from export import COMPRESSIONS
+from events import EventServer
 from socket import getaddrinfo, gaierror, AF_INET, AF_INET6, SOCK_RAW, AI_NUMERICHOST
 
 app = Flask(__name__)
@@ -84,14 +89,93 @@ def getInactivePrefixes():
     prefix = request.args.get('prefix')
     if prefix is not None and not check_prefix(prefix):
         return Response(status=400)
-    inactive_prefixes_list = controller.get_inactive_prefixes(prefix)
-    return jsonify(inactive_prefixes=inactive_prefixes_list), 200
+    # optional paging: at most limit prefixes starting after the cursor address
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    try:
+        if cursor is not None:
+            ipaddress.IPv4Address(cursor)
+        if limit is not None:
+            limit = int(limit)
+            if limit <= 0:
+                raise ValueError(limit)
+    except ValueError:
+        return Response(status=400)
+
+    # one snapshot per request, so that the ETag names the sweep generation
+    # the body comes from; polls between two sweeps get 304 Not Modified
+    snapshot = controller.get_inactive_snapshot()
+    if request.if_none_match.contains(snapshot.etag):
+        response = Response(status=304)
+    else:
+        inactive_prefixes_list, next_cursor = snapshot.page(prefix, cursor, limit)
+        response = Response(stream_json('inactive_prefixes', inactive_prefixes_list, next_cursor=next_cursor,
+                                        generation=snapshot.generation, epoch=snapshot.epoch),
+                            mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    return response
 
 @app.route('/info', methods=['GET'])
 def getInfo():
     info, headers = controller.get_gen_info()
     return jsonify(info=info, headers=headers), 200
 
+# CIDRs that became active or dark since a generation of /inactive or
+# /changes; "resync": true asks the client to fetch /inactive again
+@app.route('/changes', methods=['GET'])
+def getChanges():
+    try:
+        since = int(request.args['since'])
+    except (KeyError, ValueError):
+        return Response(status=400)
+    return jsonify(controller.get_changes(since, request.args.get('epoch'))), 200
+
+# state of addresses or prefixes: ?addr= (repeatable) or a POST of
+# {"addrs": [...]}, answered from the counters of one sweep generation
+@app.route('/status', methods=['GET', 'POST'])
+def getStatus():
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        items = body.get('addrs') if isinstance(body, dict) else None
+    else:
+        items = request.args.getlist('addr')
+    if not items:
+        return jsonify(error='no addresses or prefixes given'), 400
+    snapshot = controller.get_inactive_snapshot()
+    try:
+        status = snapshot.status(items)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(status=status, generation=snapshot.generation, epoch=snapshot.epoch), 200
+
+# the inactive space as packed binary runs (see export.py), decoded by cli.py
+@app.route('/export', methods=['GET'])
+def exportInactive():
+    compression = request.args.get('compression', 'none')
+    if compression not in COMPRESSIONS:
+        return Response(status=400)
+    snapshot = controller.get_inactive_snapshot()
+    if request.if_none_match.contains(snapshot.etag):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.export(compression), mimetype='application/octet-stream')
+    response.set_etag(snapshot.etag)
+    return response
+
+# re-read the monitored prefixes and apply the difference
+@app.route('/reload', methods=['POST'])
+def reloadMonitored():
+    try:
+        result = controller.reload_monitored()
+    except (OSError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(result), 200
+
+# used and free global_table and dark_meter index ranges
+@app.route('/utilization', methods=['GET'])
+def getUtilization():
+    return jsonify(controller.get_utilization()), 200
+
 @app.errorhandler(HTTPException)
 def handle_exception(e):
     # start with the correct headers and status code from the error
@@ -124,6 +208,15 @@ if __name__ == '__main__':
     parser.add_argument('--monitored', default='../input_files/monitored.txt', type=str)
     parser.add_argument('--outgoing', nargs='*', default=[9], type=int)
     parser.add_argument('--incoming', nargs='*', default=[8], type=int)
+    parser.add_argument('--chunk-size', default=100000, type=int)
+    parser.add_argument('--meter-tolerance', default=0.05, type=float)
+    parser.add_argument('--overrun-policy', default='skip', choices=['skip', 'catchup', 'split'])
+    parser.add_argument('--state-file', default=None, type=str)
+    parser.add_argument('--server', default='production', choices=['production', 'development'])
+    parser.add_argument('--workers', default=8, type=int)
+    parser.add_argument('--connection-limit', default=100, type=int)
+    parser.add_argument('--request-timeout', default=30, type=int)
+    parser.add_argument('--events-port', default=2003, type=int)
 
     args = parser.parse_args()
 
@@ -135,9 +228,31 @@ if __name__ == '__main__':
     port = 2002
 
     controller = LocalClient(args.interval, args.global_table_size, args.dark_meter_size, args. alpha, args.monitored, {'incoming': args.incoming, 'outgoing': args.outgoing},\
-                args.max_packet_rate, args.max_byte_rate, args.avg_packet_rate, args.avg_byte_rate)   
+                args.max_packet_rate, args.max_byte_rate, args.avg_packet_rate, args.avg_byte_rate, args.chunk_size,
+                args.meter_tolerance, args.overrun_policy, args.state_file)
+    # server-sent events with the changes of every sweep, on their own port
+    events = None
+    if args.events_port:
+        events = EventServer(controller, host_ip, args.events_port)
+        events.start()
+        controller.add_listener(events.notify)
+
+    def shutdown():
+        if events is not None:
+            events.stop()
+        controller.stop()
+
     # run iterations in the background
     thread = threading.Thread(target=controller.run, name='periodic checks')
     thread.start()
+    # SIGHUP reloads the monitored prefixes, as POST /reload does
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+        target=controller.reload_monitored, name='reload monitored').start())
 
-    app.run(host=host_ip, port=port, threaded=True)
\ No newline at end of file
+    if args.server == 'development':
+        app.run(host=host_ip, port=port, threaded=True)
+        shutdown()
+    else:
+        serve(app, host_ip, port, args.workers, args.connection_limit, args.request_timeout, shutdown)
+    # the sweep in progress completes before the process exits
+    thread.join()
\ No newline at end of file
@@ -0,0 +1,105 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+
+import threading
+from collections import deque
+import numpy as np
+from prefixes import cidr_cover
+
+
+class ChangeJournal:
+    # Addresses that became active or dark in each of the last sweeps, keyed
+    # by the generation the sweep published. Bounded by the number of
+    # generations and of addresses held; the oldest sweeps age out first.
+    def __init__(self, max_generations=64, max_addresses=1 << 22):
+        self.max_generations = max_generations
+        self.max_addresses = max_addresses
+        self.entries = deque()   # (generation, activated, deactivated) address arrays
+        self.addresses = 0
+        # changes can be given since any generation from floor to generation
+        self.floor = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def reset(self, generation):
+        # the monitored layout changed: earlier changes cannot be replayed
+        with self.lock:
+            self.entries.clear()
+            self.addresses = 0
+            self.floor = self.generation = generation
+
+    def record(self, generation, activated, deactivated):
+        with self.lock:
+            self.entries.append((generation, activated, deactivated))
+            self.addresses += len(activated) + len(deactivated)
+            self.generation = generation
+            while len(self.entries) > self.max_generations or \
+                    (self.addresses > self.max_addresses and len(self.entries) > 1):
+                self.floor, old_activated, old_deactivated = self.entries.popleft()
+                self.addresses -= len(old_activated) + len(old_deactivated)
+
+    def since(self, generation):
+        # net (latest generation, activated, deactivated) between generation
+        # and the latest one; None if those changes aged out or never existed
+        with self.lock:
+            if not self.floor <= generation <= self.generation:
+                return None
+            latest = self.generation
+            entries = [entry for entry in self.entries if entry[0] > generation]
+        addresses = np.concatenate([part for _, activated, deactivated in entries for part in (activated, deactivated)]
+                                   or [np.empty(0, dtype=np.int64)])
+        if not len(addresses):
+            return latest, addresses, addresses
+        became_active = np.concatenate([np.full(len(part), kind) for _, activated, deactivated in entries
+                                        for part, kind in ((activated, True), (deactivated, False))])
+        # transitions of an address alternate, so it changed state only if
+        # its first and last transition go the same way
+        order = np.argsort(addresses, kind='stable')
+        addresses, became_active = addresses[order].astype(np.int64), became_active[order]
+        unique, first = np.unique(addresses, return_index=True)
+        last = np.append(first[1:], len(addresses)) - 1
+        net = became_active[first] == became_active[last]
+        return latest, unique[net & became_active[last]], unique[net & ~became_active[last]]
+
+
+def address_cover(addresses):
+    # minimal CIDR cover of sorted, unique addresses
+    if not len(addresses):
+        return []
+    breaks = np.flatnonzero(np.diff(addresses) != 1)
+    starts = np.concatenate(([addresses[0]], addresses[breaks + 1]))
+    ends = np.concatenate((addresses[breaks], [addresses[-1]])) + 1
+    return cidr_cover(zip(starts.tolist(), ends.tolist()))
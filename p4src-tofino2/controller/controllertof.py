@@ -58,23 +58,46 @@ NUM_PIPES = 2
 import bfrt_grpc.client as gc
 from tabulate import tabulate
 import argparse, time, ipaddress
-from aggregate6 import aggregate
-from radix import Radix
 import threading
+import queue
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from counters import CounterStore
+from prefixes import PrefixMapping, format_address
+from inactive import InactiveCache
+from meters import MeterState
+from allocator import RangeAllocator
+from monitored import MONITORED_TABLE_SIZE, compile_monitored, read_monitored, shared_range
+from scheduler import PhaseTimer, SweepScheduler
+from state import StateFile
 import math
 
 class LocalClient:
     def __init__(self, time_interval, global_table_size, dark_meter_size, alpha, monitored_path, ports,\
-                max_pkt_rate, max_byte_rate, avg_pkt_rate, avg_byte_rate):         
+                max_pkt_rate, max_byte_rate, avg_pkt_rate, avg_byte_rate, chunk_size=100000,
+                meter_tolerance=0.05, overrun_policy='skip', state_path=None):
         self.time_interval = time_interval*60 # convert to sec
+        self.scheduler = SweepScheduler(self.time_interval, overrun_policy)
         self.global_table_size = global_table_size
-        self.dark_prefix_index_mapping = dict()
+        self.dark_meter_size = dark_meter_size
+        self.dark_index_prefix_mapping = np.empty(0, dtype=np.int64)
         self.alpha = alpha
-        self.counters = [self.alpha]*(self.global_table_size*2)
+        self.counters = CounterStore(self.global_table_size*2, self.alpha)
         self.monitored_path = monitored_path
-        self.index_prefix_mapping = []
-        self.prefix_index_mapping = Radix()
+        self.index_prefix_mapping = PrefixMapping()
+        self.inactive_cache = InactiveCache(self.index_prefix_mapping, self.counters)
         self.ports = ports
+        # dark_meter rates already on the switch; changes within tolerance are not pushed
+        self.meter_state = MeterState(dark_meter_size, meter_tolerance)
+        # optional mmap-backed counters, resumed across restarts
+        self.state_path = state_path
+        self.state = None
+        # free ranges of global_table and dark_meter; sweeps and changes of
+        # the monitored layout hold layout_lock
+        self.index_allocator = RangeAllocator(self.global_table_size)
+        self.dark_allocator = RangeAllocator(self.dark_meter_size)
+        self.layout_lock = threading.Lock()
+        self.chunk_size = chunk_size # register entries per half read/processed/written per step
 
         self.max_pkt_rate = max_pkt_rate
         self.max_byte_rate = max_byte_rate
@@ -86,28 +109,32 @@ class LocalClient:
         self.avg_pkt_rate_addr = round(self.avg_pkt_rate / self.global_table_size, 3)
         self.avg_byte_rate_addr = round(self.avg_byte_rate / self.global_table_size, 3)
 
-        self.lock = threading.Lock()
         self._setup()
 
     def parse_monitored(self, path):
-        monitored_prefixes = []
-        with open(path, 'r') as f:
-            for line in f:
-                if line.startswith('#'):
-                    continue
-                monitored_prefixes.append(line[:-1])
-        return monitored_prefixes
+        # the monitored file compiled into the prefixes to program
+        # a register entry holds the pair of addresses of a /31, so longer
+        # prefixes would take no entries and break the mask
+        prefixes, footprint = compile_monitored(read_monitored(path), max_prefixlen=31)
+        registers = sum(self.block_entries(ipaddress.IPv4Network(prefix)) for prefix in prefixes)
+        logging.info(f'Monitored prefixes from {path}: {footprint["lines"]} listed, {footprint["duplicates"]} duplicate, '
+                     f'{footprint["merged"]} merged into neighbours; {footprint["entries"]}/{footprint["table_size"]} monitored, '
+                     f'{registers}/{self.global_table_size} global_table and '
+                     f'{footprint["dark_meters"]}/{self.dark_meter_size} dark_meter entries')
+        return prefixes
 
     def _setup(self):
+        timer = PhaseTimer()
         bfrt_client_id = 0
 
-        self.interface = gc.ClientInterface(
-            grpc_addr = 'localhost:50052',
-            client_id = bfrt_client_id,
-            device_id = 0,
-            num_tries = 1)
+        with timer.phase('connect'):
+            self.interface = gc.ClientInterface(
+                grpc_addr = 'localhost:50052',
+                client_id = bfrt_client_id,
+                device_id = 0,
+                num_tries = 1)
 
-        self.bfrt_info = self.interface.bfrt_info_get()
+            self.bfrt_info = self.interface.bfrt_info_get()
         self.dev_tgt = gc.Target(0)
         print('The target runs the program ', self.bfrt_info.p4_name_get())
 
@@ -121,11 +148,42 @@ class LocalClient:
         self.dark_meter = self.bfrt_info.table_get('pipe.Ingress.dark_meter')
         self.dark_global_meter = self.bfrt_info.table_get('pipe.Ingress.dark_global_meter')
         self.interface.bind_pipeline_config(self.bfrt_info.p4_name_get())
-        self.add_mirroring([10, 10, 11], 1, 2)
-        monitored_prefixes = self.parse_monitored(self.monitored_path)
-        self.populate_monitored(monitored_prefixes)
-        self.add_ports(self.ports)
-        self.set_rates()
+        with timer.phase('mirroring'):
+            self.add_mirroring([10, 10, 11], 1, 2)
+        with timer.phase('monitored'):
+            monitored_prefixes = self.parse_monitored(self.monitored_path)
+            # entries left by a previous run would keep its layout
+            self.clear_entries(self.monitored_table)
+            self.populate_monitored(monitored_prefixes)
+        with timer.phase('state'):
+            generation = self.resume_state() if self.state_path else None
+            self.inactive_cache.rebuild(generation)
+        with timer.phase('ports'):
+            self.clear_entries(self.ports_table)
+            self.add_ports(self.ports)
+        with timer.phase('meters'):
+            self.set_rates()
+        logging.info(f'Startup took {timer.total():.3f} secs ({timer})')
+
+    def resume_state(self):
+        # resume the saved counters of the prefixes still monitored, wherever
+        # they are placed now, and bring global_table in line with them
+        self.state = StateFile(self.state_path, self.index_prefix_mapping)
+        values = self.counters.draft()
+        generation = self.state.open(values)
+        if generation is None:
+            logging.info(f'No state to resume in {self.state_path}, starting from alpha')
+            return None
+        # a smaller alpha than last run only shortens the remaining lifetimes
+        np.minimum(values, self.alpha + 1, out=values)
+        self.counters.publish(values)
+        size = len(self.index_prefix_mapping)
+        active = values[:size] > 0
+        # one bulk write per half: 1 where the resumed counters are live, 0 where dark
+        self.write_halves((self.global_table0, self.global_table1), np.flatnonzero(active),
+                          np.flatnonzero(~active))
+        logging.info(f'Resumed counters of generation {generation} from {self.state_path}')
+        return generation
 
     def set_rates(self):
         # set global rate
@@ -142,101 +200,322 @@ class LocalClient:
             pass
 
         # only for packet rate for now
+        self.set_dark_rates(np.flatnonzero(self.dark_index_prefix_mapping >= 0))
+
+    def set_dark_rates(self, indices):
+        # initial per-/24 rate of the given dark meters
         prefix_max_pkt_rate = math.ceil(self.max_pkt_rate_addr * 256) # per /24
         prefix_avg_pkt_rate = math.ceil(self.avg_pkt_rate_addr * 256) # per /24
 
+        indices = np.asarray(indices, dtype=np.int64)
+        self.program_dark_meters(indices, np.full(len(indices), prefix_avg_pkt_rate),
+                                 np.full(len(indices), prefix_max_pkt_rate))
+
+    def program_dark_meters(self, indices, cir, pir):
+        # per-index rates in one batch; recorded in meter_state only on success,
+        # so failed meters are retried
         key_field_list = []
         data_field_list = []
-        for i in range(len(self.dark_prefix_index_mapping)):
-            # set rate for /24
-            key_field_list.append(self.dark_meter.make_key([gc.KeyTuple('$METER_INDEX', i)]))
+        for idx, avg_rate, max_rate in zip(np.asarray(indices).tolist(), np.asarray(cir).tolist(), np.asarray(pir).tolist()):
+            key_field_list.append(self.dark_meter.make_key([gc.KeyTuple('$METER_INDEX', idx)]))
             data_field_list.append(self.dark_meter.make_data(
-            [gc.DataTuple('$METER_SPEC_CIR_PPS', prefix_avg_pkt_rate),
-             gc.DataTuple('$METER_SPEC_PIR_PPS', prefix_max_pkt_rate),
+            [gc.DataTuple('$METER_SPEC_CIR_PPS', avg_rate),
+             gc.DataTuple('$METER_SPEC_PIR_PPS', max_rate),
              gc.DataTuple('$METER_SPEC_CBS_PKTS', 100),
              gc.DataTuple('$METER_SPEC_PBS_PKTS', 100)]))
+        if not key_field_list:
+            return True
         try:
             self.dark_meter.entry_add(self.dev_tgt, key_field_list, data_field_list)
-        except:
-            pass
-
-    def update_rates(self, inactive_pfxs, inactive_addr):
+        except Exception as e:
+            logging.error(f'Programming {len(key_field_list)} dark meters failed: {e}')
+            return False
+        self.meter_state.record(indices, cir, pir)
+        return True
+
+    def update_rates(self, dark_counts, inactive_addr):
+        if not inactive_addr:
+            # nothing is dark, so no dark meter is in use
+            return
         addr_avg_pkt_rate = math.ceil(self.avg_pkt_rate / inactive_addr) # per /24
         addr_max_pkt_rate = math.ceil(self.max_pkt_rate / inactive_addr) # per /24
 
-        key_field_list = []
-        data_field_list = []
-        for inactive_pfx, in_addr in inactive_pfxs.items():
-            prefix_max_pkt_rate = math.ceil(addr_max_pkt_rate * in_addr) # per /24
-            prefix_avg_pkt_rate = math.ceil(addr_avg_pkt_rate * in_addr) # per /24
+        # dark_counts holds the number of inactive addresses per dark meter
+        indices = np.flatnonzero(dark_counts)
+        in_addr = dark_counts[indices]
+        prefix_max_pkt_rate = addr_max_pkt_rate * in_addr # per /24
+        prefix_avg_pkt_rate = addr_avg_pkt_rate * in_addr # per /24
+
+        # only push the meters whose rate moved beyond the tolerance
+        changed = self.meter_state.changed(indices, prefix_avg_pkt_rate, prefix_max_pkt_rate)
+        indices = indices[changed]
+        prefix_avg_pkt_rate = prefix_avg_pkt_rate[changed]
+        prefix_max_pkt_rate = prefix_max_pkt_rate[changed]
+        if not len(indices):
+            return
+
+        if self.program_dark_meters(indices, prefix_avg_pkt_rate, prefix_max_pkt_rate):
+            logging.info(f'Updated {len(indices)} of {np.count_nonzero(dark_counts)} dark meters')
+
+    def add_entries(self, table, keys, data):
+        # program a whole batch in one call; failures (e.g. entries left over
+        # from a previous run) are reported instead of silently dropped
+        if not keys:
+            return
+        try:
+            table.entry_add(self.dev_tgt, keys, data)
+        except Exception as e:
+            logging.warning(f'Adding {len(keys)} entries to {table.info.name_get()} failed: {e}')
 
-            idx = self.dark_prefix_index_mapping[inactive_pfx]
-            key_field_list.append(self.dark_meter.make_key([gc.KeyTuple('$METER_INDEX', idx)]))
-            data_field_list.append(self.dark_meter.make_data(
-            [gc.DataTuple('$METER_SPEC_CIR_PPS', prefix_avg_pkt_rate),
-             gc.DataTuple('$METER_SPEC_PIR_PPS', prefix_max_pkt_rate),
-             gc.DataTuple('$METER_SPEC_CBS_PKTS', 100),
-             gc.DataTuple('$METER_SPEC_PBS_PKTS', 100)]))
+    def clear_entries(self, table):
+        # delete every entry of the table, e.g. those programmed by a previous run
+        try:
+            table.entry_del(self.dev_tgt)
+        except Exception as e:
+            logging.warning(f'Clearing {table.info.name_get()} failed: {e}')
 
+    def delete_entries(self, table, keys):
+        if not keys:
+            return
         try:
-            self.dark_meter.entry_add(self.dev_tgt, key_field_list, data_field_list)
-        except:
-            pass
+            table.entry_del(self.dev_tgt, keys)
+        except Exception as e:
+            logging.warning(f'Deleting {len(keys)} entries from {table.info.name_get()} failed: {e}')
 
-    def add_ports(self, ports):
-        # incoming
-        for port in ports['incoming']:
-            _keys = self.ports_table.make_key([gc.KeyTuple('ig_intr_md.ingress_port', port)])
-            _data = self.monitored_table.make_data([], 'Ingress.set_incoming')
-            try:
-                self.ports_table.entry_add(self.dev_tgt, [_keys], [_data])
-            except:
-                pass
-
-        for port in ports['outgoing']:
-            _keys = self.ports_table.make_key([gc.KeyTuple('ig_intr_md.ingress_port', port)])
-            _data = self.monitored_table.make_data([], 'Ingress.set_outgoing')
-            try:
-                self.ports_table.entry_add(self.dev_tgt, [_keys], [_data])
-            except:
-                pass
+    def modify_entries(self, table, keys, data):
+        if not keys:
+            return
+        try:
+            table.entry_mod(self.dev_tgt, keys, data)
+        except Exception as e:
+            logging.warning(f'Modifying {len(keys)} entries of {table.info.name_get()} failed: {e}')
 
+    def add_ports(self, ports):
+        _keys = []
+        _data = []
+        for direction, action in (('incoming', 'Ingress.set_incoming'), ('outgoing', 'Ingress.set_outgoing')):
+            for port in ports[direction]:
+                _keys.append(self.ports_table.make_key([gc.KeyTuple('ig_intr_md.ingress_port', port)]))
+                _data.append(self.ports_table.make_data([], action))
+        self.add_entries(self.ports_table, _keys, _data)
 
     def optimize_allocation(self, switches):
         pass
 
     def populate_monitored(self, entries):
-        base_idx = 0
-        dark_base_idx = 0
-        for entry in entries:
-            prefix, length = entry.split('/')
-            mask = 2**(31 - int(length)) - 1
-            _keys = self.monitored_table.make_key([gc.KeyTuple('meta.addr', prefix, None, int(length))])
-            _data = self.monitored_table.make_data([
-                gc.DataTuple('base_idx', base_idx),
-                gc.DataTuple('mask', mask),
-                gc.DataTuple('dark_base_idx', dark_base_idx)
-                ], 'Ingress.calc_idx')
-            try:
-                self.monitored_table.entry_add(self.dev_tgt, [_keys], [_data])
-            except:
-                pass
+        self.index_allocator.reset()
+        self.dark_allocator.reset()
+        self.dark_index_prefix_mapping = np.full(self.dark_meter_size, -1, dtype=np.int64)
+        self.add_monitored(entries)
+        logging.info(f'Index space: {self.get_utilization()}')
+
+    def block_entries(self, ipnet):
+        # register entries taken by a monitored block in each half
+        return ipnet.num_addresses // 2
+
+    def monitored_entry(self, ipnet, base_idx, dark_base_idx):
+        _key = self.monitored_table.make_key([gc.KeyTuple('meta.addr', str(ipnet.network_address), None, ipnet.prefixlen)])
+        _data = self.monitored_table.make_data([
+            gc.DataTuple('base_idx', base_idx),
+            gc.DataTuple('mask', 2**(31 - ipnet.prefixlen) - 1),
+            gc.DataTuple('dark_base_idx', dark_base_idx)
+        ], 'Ingress.calc_idx')
+        return _key, _data
+
+    def add_monitored(self, entries):
+        self.program_monitored(self.place_monitored(entries))
+
+    def place_monitored(self, entries):
+        # allocate ranges for the prefixes, largest first so that blocks pack
+        # without holes; returns (ipnet, base_idx, dark_base_idx) per block
+        nets = sorted((ipaddress.IPv4Network(entry) for entry in entries), key=lambda net: net.prefixlen)
+        if not self.index_allocator.fits([self.block_entries(net) for net in nets]) or \
+                not self.dark_allocator.fits([2**max(24 - net.prefixlen, 0) for net in nets]):
+            raise ValueError(f'{len(nets)} prefixes do not fit in the free global_table and dark_meter ranges')
+        blocks = []
+        for ipnet in nets:
+            # dark meters are per /24: dark_meter index -> /24 network (address >> 8)
+            num_dark = 2**max(24 - ipnet.prefixlen, 0)
+            base_idx = self.index_allocator.allocate(self.block_entries(ipnet))
+            dark_base_idx = self.dark_allocator.allocate(num_dark)
             # save in local dictionary in /32s
-            ipnet = ipaddress.IPv4Network(entry)
-            netws = list(ipnet.subnets(new_prefix=32))
-            self.index_prefix_mapping.extend(netws)
-
-            for i in range(len(netws)):
-                node = self.prefix_index_mapping.add(str(netws[i]))
-                node.data['index'] = 2*base_idx + i
-            base_idx += len(netws) / 2
-
-            dark_netws = list(ipnet.subnets(new_prefix=24))
-            for i in range(len(dark_netws)):
-                dark_netw = '.'.join(str(dark_netws[i]).split('.')[:3])
-                self.dark_prefix_index_mapping[dark_netw] = dark_base_idx + i            
-
-            dark_base_idx += len(dark_netws)
+            self.index_prefix_mapping.add(ipnet, 2*base_idx, dark_base_idx)
+            network = int(ipnet.network_address)
+            self.dark_index_prefix_mapping[dark_base_idx:dark_base_idx + num_dark] = \
+                np.arange(network >> 8, (network >> 8) + num_dark)
+            blocks.append((ipnet, 2*base_idx, dark_base_idx))
+        return blocks
+
+    def program_monitored(self, blocks):
+        # all monitored entries in one batch
+        _keys = []
+        _data = []
+        for ipnet, base_idx, dark_base_idx in blocks:
+            _key, _data_entry = self.monitored_entry(ipnet, base_idx // 2, dark_base_idx)
+            _keys.append(_key)
+            _data.append(_data_entry)
+        self.add_entries(self.monitored_table, _keys, _data)
+
+    def reload_monitored(self, path=None):
+        # re-read the monitored list and apply only the difference: removed
+        # prefixes lose their entries and free their ranges, added ones are
+        # placed in free global_table and dark_meter ranges (compacting the
+        # live blocks if the free space is too fragmented), and the counters
+        # of unchanged prefixes carry over
+        entries = self.parse_monitored(path or self.monitored_path)
+        with self.layout_lock:
+            current = self.index_prefix_mapping.prefixes()
+            removed = [prefix for prefix in current if prefix not in entries]
+            added = [entry for entry in entries if entry not in current]
+
+            # refuse the whole reload if the added prefixes do not fit even
+            # once the removed ones are freed and the rest compacted
+            old_nets = [ipaddress.IPv4Network(prefix) for prefix in removed]
+            nets = [ipaddress.IPv4Network(entry) for entry in added]
+            needed = sum(self.block_entries(net) for net in nets)
+            needed_dark = sum(2**max(24 - net.prefixlen, 0) for net in nets)
+            if needed > self.index_allocator.free + sum(self.block_entries(net) for net in old_nets) or \
+                    needed_dark > self.dark_allocator.free + sum(2**max(24 - net.prefixlen, 0) for net in old_nets):
+                raise ValueError(f'{len(added)} added prefixes need {needed} global_table and '
+                                 f'{needed_dark} dark_meter entries, more than are free')
+
+            counters = self.counters.draft()
+            carried = []
+            _keys = []
+            freed = []
+            for net in old_nets:
+                base_idx, dark_base_idx = self.index_prefix_mapping.remove(net)
+                num_dark = 2**max(24 - net.prefixlen, 0)
+                _keys.append(self.monitored_entry(net, 0, 0)[0])
+                # unused ranges hold 0, which never ages, so they cost no writes
+                carried.append((net, counters[base_idx:base_idx + net.num_addresses].copy()))
+                counters[base_idx:base_idx + net.num_addresses] = 0
+                freed.append(np.arange(base_idx, base_idx + net.num_addresses))
+                self.index_allocator.release(base_idx // 2, self.block_entries(net))
+                self.dark_allocator.release(dark_base_idx, num_dark)
+                self.dark_index_prefix_mapping[dark_base_idx:dark_base_idx + num_dark] = -1
+            self.delete_entries(self.monitored_table, _keys)
+            # with the entries gone no new flag can appear in the freed ranges;
+            # read the flags set since the last sweep before clearing them
+            freed = np.concatenate(freed) if freed else np.empty(0, dtype=np.int64)
+            flags = np.zeros(0, dtype=bool)
+            if len(freed):
+                for table in (self.flag_table0, self.flag_table1):
+                    table.operations_execute(self.dev_tgt, 'Sync')
+                flags = self.read_halves((self.flag_table0, self.flag_table1), freed)
+            flags = np.split(flags, np.cumsum([net.num_addresses for net, _ in carried])[:-1])
+            carried = [(net, values, block_flags) for (net, values), block_flags in zip(carried, flags)]
+            for tables in ((self.flag_table0, self.flag_table1), (self.global_table0, self.global_table1)):
+                self.write_halves(tables, [], freed)
+
+            if not self.index_allocator.fits(sorted((self.block_entries(net) for net in nets), reverse=True)) or \
+                    not self.dark_allocator.fits(sorted((2**max(24 - net.prefixlen, 0) for net in nets), reverse=True)):
+                counters = self.compact(counters)
+            blocks = self.place_monitored(added)
+            new = [np.arange(base_idx, base_idx + net.num_addresses) for net, base_idx, _ in blocks]
+            new = np.concatenate(new) if new else np.empty(0, dtype=np.int64)
+            # start the new ranges as at startup before their entries exist:
+            # no flags, and global_table 1 to match counters at alpha
+            self.write_halves((self.flag_table0, self.flag_table1), [], new)
+            self.write_halves((self.global_table0, self.global_table1), new, [])
+            counters[new] = self.alpha
+            # where added prefixes merge or split removed ones, the shared
+            # addresses keep their counters and global_table state
+            kept = []
+            kept_flags = []
+            for old_net, old_values, old_flags in carried:
+                for net, base_idx, _ in blocks:
+                    shared = shared_range(old_net, net)
+                    if shared is not None:
+                        old_offset, offset, length = shared
+                        counters[base_idx + offset:base_idx + offset + length] = old_values[old_offset:old_offset + length]
+                        kept.append(np.arange(base_idx + offset, base_idx + offset + length))
+                        kept_flags.append(old_flags[old_offset:old_offset + length])
+            if kept:
+                # the flags set since the last sweep move with their addresses;
+                # a flagged address holds global_table 1 even when its counter is 0
+                order = np.argsort(np.concatenate(kept))
+                kept = np.concatenate(kept)[order]
+                flagged = np.concatenate(kept_flags)[order]
+                live = (counters[kept] > 0) | flagged
+                self.write_halves((self.global_table0, self.global_table1), kept[live], kept[~live])
+                self.write_halves((self.flag_table0, self.flag_table1), kept[flagged], [])
+            self.program_monitored(blocks)
+            self.set_dark_rates([dark_base_idx + i for net, _, dark_base_idx in blocks
+                                 for i in range(2**max(24 - net.prefixlen, 0))])
+
+            self.counters.publish(counters)
+            self.inactive_cache.rebuild()
+            if self.state is not None:
+                self.state.save(self.counters.snapshot(), self.inactive_cache.generation)
+
+        logging.info(f'Reloaded monitored prefixes: {len(added)} added, {len(removed)} removed, '
+                     f'{len(current) - len(removed)} unchanged; index space: {self.get_utilization()}')
+        return {'added': added, 'removed': removed, 'unchanged': len(current) - len(removed)}
+
+    def compact(self, values):
+        # slide the live blocks to the bottom of global_table and dark_meter so
+        # that the free space becomes one range; returns the moved counters.
+        # Traffic in the few ms between reading the old flags and updating the
+        # entries may be credited to the wrong address once.
+        blocks = [(ipaddress.IPv4Network(prefix), base_idx, dark_base_idx)
+                  for prefix, (base_idx, dark_base_idx) in self.index_prefix_mapping.prefixes().items()]
+        bases = self.index_allocator.compact([(base_idx // 2, self.block_entries(net)) for net, base_idx, _ in blocks])
+        dark_bases = self.dark_allocator.compact([(dark_base_idx, 2**max(24 - net.prefixlen, 0))
+                                                  for net, _, dark_base_idx in blocks])
+        moves = [(net, base_idx, 2*new_base_idx, dark_base_idx, new_dark_base_idx)
+                 for (net, base_idx, dark_base_idx), new_base_idx, new_dark_base_idx in zip(blocks, bases, dark_bases)
+                 if (base_idx, dark_base_idx) != (2*new_base_idx, new_dark_base_idx)]
+        if not moves:
+            return values
+        old = np.concatenate([np.arange(base_idx, base_idx + net.num_addresses) for net, base_idx, _, _, _ in moves])
+        new = np.concatenate([np.arange(base_idx, base_idx + net.num_addresses) for net, _, base_idx, _, _ in moves])
+        old_dark = np.concatenate([np.arange(base_idx, base_idx + 2**max(24 - net.prefixlen, 0)) for net, _, _, base_idx, _ in moves])
+        new_dark = np.concatenate([np.arange(base_idx, base_idx + 2**max(24 - net.prefixlen, 0)) for net, _, _, _, base_idx in moves])
+
+        # the flags set since the last sweep move with their addresses, so the
+        # next sweep sees the activity as if the blocks had not moved
+        for table in (self.flag_table0, self.flag_table1):
+            table.operations_execute(self.dev_tgt, 'Sync')
+        active = self.read_halves((self.flag_table0, self.flag_table1), old)
+        moved = values.copy()
+        moved[old] = 0
+        moved[new] = values[old]
+
+        # meters and registers of the new ranges first, then the entries, then
+        # whatever the old ranges leave behind; only meters programmed before
+        # carry a rate over
+        programmed = self.meter_state.programmed[old_dark]
+        self.program_dark_meters(new_dark[programmed], self.meter_state.cir[old_dark[programmed]],
+                                 self.meter_state.pir[old_dark[programmed]])
+        # a flagged address holds global_table 1 even when its counter is 0
+        live = (moved[new] > 0) | active
+        self.write_halves((self.global_table0, self.global_table1), new[live], new[~live])
+        self.write_halves((self.flag_table0, self.flag_table1), new[active], new[~active])
+        _keys = []
+        _data = []
+        for net, _, base_idx, _, dark_base_idx in moves:
+            _key, _data_entry = self.monitored_entry(net, base_idx // 2, dark_base_idx)
+            _keys.append(_key)
+            _data.append(_data_entry)
+        self.modify_entries(self.monitored_table, _keys, _data)
+        left = np.setdiff1d(old, new)
+        for tables in ((self.flag_table0, self.flag_table1), (self.global_table0, self.global_table1)):
+            self.write_halves(tables, [], left)
+
+        dark_prefixes = self.dark_index_prefix_mapping.copy()
+        self.dark_index_prefix_mapping[old_dark] = -1
+        self.dark_index_prefix_mapping[new_dark] = dark_prefixes[old_dark]
+        for net, _, base_idx, _, dark_base_idx in moves:
+            self.index_prefix_mapping.remove(net)
+            self.index_prefix_mapping.add(net, base_idx, dark_base_idx)
+        logging.info(f'Compacted {len(moves)} monitored blocks ({len(old)} addresses moved)')
+        return moved
+
+    def get_utilization(self):
+        monitored = len(self.index_prefix_mapping.prefixes())
+        return {'monitored': {'size': MONITORED_TABLE_SIZE, 'used': monitored, 'free': MONITORED_TABLE_SIZE - monitored},
+                'global_table': self.index_allocator.report(), 'dark_meter': self.dark_allocator.report()}
 
     def add_mirroring(self, eg_ports, mc_session_id, log_session_id):
         mirror_table = self.bfrt_info.table_get('$mirror.cfg')
@@ -244,64 +523,37 @@ class LocalClient:
         pre_mgid_table = self.bfrt_info.table_get('$pre.mgid')
         rec_ports = [RECIRCULATE_PORT + 128*x for x in range(NUM_PIPES)]
 
-        rid = 1
-        
-        # multicast nodes
-        for port in eg_ports:
-            for _ in range(3):
-                l1_node_key = pre_node_table.make_key([gc.KeyTuple('$MULTICAST_NODE_ID', rid)])
-                l2_node = pre_node_table.make_data([
-                    gc.DataTuple('$MULTICAST_RID', rid),
-                    gc.DataTuple('$DEV_PORT', int_arr_val=[port])
-                ])
-                rid += 1
-                try:
-                    pre_node_table.entry_add(self.dev_tgt, [l1_node_key], [l2_node])   
-                except:
-                    pass
-
-        # multicast group
-        mg_id_key = pre_mgid_table.make_key([gc.KeyTuple('$MGID', 1)])
-        
-        mg_id_data = pre_mgid_table.make_data([
-            gc.DataTuple('$MULTICAST_NODE_ID', int_arr_val=list(range(1, rid))),
-            gc.DataTuple('$MULTICAST_NODE_L1_XID_VALID', bool_arr_val=[False]*(rid-1)),
-            gc.DataTuple('$MULTICAST_NODE_L1_XID', int_arr_val=[0]*(rid-1)),
-        ])
-
-        try:
-            pre_mgid_table.entry_add(self.dev_tgt, [mg_id_key], [mg_id_data])
-        except:
-            pass
-
-        init_rid = rid
-        # recirculation nodes
-        for port in rec_ports:
-            l1_node_key = pre_node_table.make_key([gc.KeyTuple('$MULTICAST_NODE_ID', rid)])
-            l2_node = pre_node_table.make_data([
+        # multicast nodes: three copies per egress port (group 1), then one per
+        # recirculation port (group 2), all added in one batch
+        node_ports = [port for port in eg_ports for _ in range(3)]
+        init_rid = len(node_ports) + 1
+        node_ports.extend(rec_ports)
+        node_keys = []
+        node_data = []
+        for rid, port in enumerate(node_ports, 1):
+            node_keys.append(pre_node_table.make_key([gc.KeyTuple('$MULTICAST_NODE_ID', rid)]))
+            node_data.append(pre_node_table.make_data([
                 gc.DataTuple('$MULTICAST_RID', rid),
                 gc.DataTuple('$DEV_PORT', int_arr_val=[port])
-            ])
-            rid += 1
-            try:
-                pre_node_table.entry_add(self.dev_tgt, [l1_node_key], [l2_node])   
-            except:
-                pass
-
-        # multicast group
-        mg_id_key = pre_mgid_table.make_key([gc.KeyTuple('$MGID', 2)])
-        mg_id_data = pre_mgid_table.make_data([
-            gc.DataTuple('$MULTICAST_NODE_ID', int_arr_val=list(range(init_rid, rid))),
-            gc.DataTuple('$MULTICAST_NODE_L1_XID_VALID', bool_arr_val=[False]*(rid-init_rid)),
-            gc.DataTuple('$MULTICAST_NODE_L1_XID', int_arr_val=[0]*(rid-init_rid)),
-        ])
-        try:
-            pre_mgid_table.entry_add(self.dev_tgt, [mg_id_key], [mg_id_data])
-        except:
-            pass
-
-        mirror_key  = mirror_table.make_key([gc.KeyTuple('$sid', mc_session_id)])
-        mirror_data = mirror_table.make_data([
+            ]))
+        self.add_entries(pre_node_table, node_keys, node_data)
+        rid = len(node_ports) + 1
+
+        # multicast groups
+        mgid_keys = []
+        mgid_data = []
+        for mgid, nodes in ((1, range(1, init_rid)), (2, range(init_rid, rid))):
+            mgid_keys.append(pre_mgid_table.make_key([gc.KeyTuple('$MGID', mgid)]))
+            mgid_data.append(pre_mgid_table.make_data([
+                gc.DataTuple('$MULTICAST_NODE_ID', int_arr_val=list(nodes)),
+                gc.DataTuple('$MULTICAST_NODE_L1_XID_VALID', bool_arr_val=[False]*len(nodes)),
+                gc.DataTuple('$MULTICAST_NODE_L1_XID', int_arr_val=[0]*len(nodes)),
+            ]))
+        self.add_entries(pre_mgid_table, mgid_keys, mgid_data)
+
+        mirror_keys = [mirror_table.make_key([gc.KeyTuple('$sid', mc_session_id)]),
+                       mirror_table.make_key([gc.KeyTuple('$sid', log_session_id)])]
+        mirror_data = [mirror_table.make_data([
             gc.DataTuple('$direction', str_val="BOTH"),
             gc.DataTuple('$session_enable', bool_val=True),
             gc.DataTuple('$mcast_rid', 1),
@@ -310,24 +562,13 @@ class LocalClient:
             gc.DataTuple('$mcast_grp_b', 2),
             gc.DataTuple('$mcast_grp_b_valid', bool_val=True),
             gc.DataTuple('$max_pkt_len', 40)
-        ], "$normal")
-        try:
-            mirror_table.entry_add(self.dev_tgt, [mirror_key], [mirror_data])
-        except:
-            pass  
-
-        mirror_key  = mirror_table.make_key([gc.KeyTuple('$sid', log_session_id)])
-        mirror_data = mirror_table.make_data([
+        ], "$normal"), mirror_table.make_data([
             gc.DataTuple('$direction', str_val="BOTH"),
             gc.DataTuple('$session_enable', bool_val=True),
             gc.DataTuple('$ucast_egress_port', LOG_PORT),
             gc.DataTuple('$ucast_egress_port_valid', bool_val=True)
-            ], "$normal")
-
-        try:
-            mirror_table.entry_add(self.dev_tgt, [mirror_key], [mirror_data])
-        except:
-            pass
+        ], "$normal")]
+        self.add_entries(mirror_table, mirror_keys, mirror_data)
 
     def get_gen_info(self):
         
@@ -352,80 +593,167 @@ class LocalClient:
         headers = ['Full Table Name','Type','Usage','Capacity']
         return data, headers
 
-    def read_register(self, table, index, flags={"from_hw": True}):
-        _keys = table.make_key([gc.KeyTuple("$REGISTER_INDEX", index)])
-        data, _ = next(table.entry_get(
-            self.dev_tgt,
-            [
-                _keys
-            ],
-            flags=flags
-        ))
+    def read_register(self, table, index_range, flags={"from_hw": True}):
+        _keys = [table.make_key([gc.KeyTuple("$REGISTER_INDEX", index)]) for index in index_range]
         data_name = table.info.data_dict_allname["f1"]
-        return data.to_dict()[data_name]
+        results = []
+        for entry in table.entry_get(self.dev_tgt, _keys, flags=flags):
+            data = entry[0].to_dict()
+            results.append(data[data_name])
 
-    def write_register(self, table, index, value, flags={"from_hw": True}):
+        return results
 
-        _keys = table.make_key([gc.KeyTuple("$REGISTER_INDEX", index)])
-        data_name = table.info.data_dict_allname["f1"]
-        _data = table.make_data([gc.DataTuple(data_name, value)])
+    def write_register(self, table, keys_1, keys_0):
+        _keys = [table.make_key([gc.KeyTuple("$REGISTER_INDEX", index)]) for index in keys_1]
+        _keys.extend([table.make_key([gc.KeyTuple("$REGISTER_INDEX", index)]) for index in keys_0])
 
-        table.entry_add(self.dev_tgt, [_keys], [_data])
+        data_name = table.info.data_dict_allname["f1"]
+        _data = [table.make_data([gc.DataTuple(data_name, 1)])]*len(keys_1)
+        _data.extend([table.make_data([gc.DataTuple(data_name, 0)])]*len(keys_0))
+
+        if _keys:
+            table.entry_add(self.dev_tgt, _keys, _data)
+
+    def write_halves(self, tables, keys_1, keys_0):
+        # logical index i lives at i//2 in tables[0] (even i) or tables[1] (odd i)
+        keys_1 = np.asarray(keys_1, dtype=np.int64)
+        keys_0 = np.asarray(keys_0, dtype=np.int64)
+        for pos, table in enumerate(tables):
+            self.write_register(table, (keys_1[keys_1 % 2 == pos] // 2).tolist(),
+                                (keys_0[keys_0 % 2 == pos] // 2).tolist())
+
+    def read_halves(self, tables, indices):
+        # flags of logical indices, each read from the half it lives in
+        indices = np.asarray(indices, dtype=np.int64)
+        active = np.zeros(len(indices), dtype=bool)
+        for pos, table in enumerate(tables):
+            half = indices % 2 == pos
+            flags = self.read_register(table, (indices[half] // 2).tolist())
+            if flags:
+                active[half] = np.array(flags, dtype=np.uint8).reshape(len(flags), -1).any(axis=1)
+        return active
+
+    def _read_flag_chunks(self, chunks, start, end, size):
+        # reader thread: read the same register range of both halves and
+        # de-interleave them into one chunk of logical (per-address) flags
+        try:
+            for start in range(start, end, self.chunk_size):
+                stop = min(start + self.chunk_size, end)
+                active = np.zeros(2*(stop - start), dtype=bool)
+                for pos, table in enumerate((self.flag_table0, self.flag_table1)):
+                    flags = self.read_register(table, range(start, stop))
+                    # one row per index, one column per pipe
+                    active[pos::2] = np.array(flags, dtype=np.uint8).reshape(len(flags), -1).any(axis=1)
+                chunks.put((2*start, active[:size - 2*start]))
+        except Exception as e:
+            chunks.put(e)
+            return
+        chunks.put(None)
 
     def get_inactive_prefixes(self, covering_prefix=None):
-        inactive_prefixes = []
-        with self.lock:
-            if covering_prefix is None:
-                for i in range(len(self.index_prefix_mapping)):
-                    if not self.counters[i]:
-                        inactive_prefixes.append(str(self.index_prefix_mapping[i]))
-            else:
-                covered = self.prefix_index_mapping.search_covered(covering_prefix)
-                for node in covered:
-                    if not self.counters[node.data['index']]:
-                        inactive_prefixes.append(str(node.prefix))
-        
-        return aggregate(inactive_prefixes)
+        # served from the cache refreshed by every sweep
+        return self.inactive_cache.get(covering_prefix)
+
+    def get_changes(self, since, epoch=None):
+        return self.inactive_cache.changes(since, epoch)
+
+    def add_listener(self, callback):
+        # callback() runs in the sweep thread after every published generation
+        self.inactive_cache.listeners.append(callback)
+
+    def get_inactive_snapshot(self):
+        # the published InactiveSnapshot, for answers that must come from one generation
+        return self.inactive_cache.snapshot
 
     def run(self):
-        while True:
-            logging.info('Starting collecting values...')
-            # collect global table(s)
-            inactive_pfxs = dict()
-            inactive_addr = 0
-            for i in range(len(self.index_prefix_mapping)):
-                active = 0
-
-                flag_table = self.flag_table0 if not i%2 else self.flag_table1
-                global_table = self.global_table0 if not i%2 else self.global_table1
-
-                t_val = self.read_register(flag_table, int(i/2))
-                active |= int(any(t_val))
-                with self.lock:
-                    if active:
-                        if not self.counters[i]:
-                            self.write_register(global_table, int(i/2) , 1)
-                            logging.warning(f'Prefix {self.index_prefix_mapping[i]} became active.')
-                        self.write_register(flag_table, int(i/2), 0)
-                        self.counters[i] = self.alpha + 1
-                    else:
-                        if self.counters[i] > 1:
-                            self.counters[i] -= 1
-                        else:
-                            inactive_addr += 1
-                            pfx = ".".join(str(self.index_prefix_mapping[i]).split(".")[:3])
-                            if pfx not in inactive_pfxs:
-                                inactive_pfxs[pfx] = 0
-                            inactive_pfxs[pfx] += 1
-
-                            if self.counters[i] == 1:
-                                self.write_register(global_table, int(i/2), 0)
-                                self.counters[i] = 0
-
-            self.update_rates(inactive_pfxs, inactive_addr)
-     
-            logging.info(f'Waiting for {self.time_interval} secs...')
-            time.sleep(self.time_interval)
+        def sweep(timer, part, parts):
+            with self.layout_lock:
+                self.sweep(timer, part, parts)
+        try:
+            self.scheduler.run(sweep)
+        finally:
+            with self.layout_lock:
+                if self.state is not None:
+                    self.state.close()
+                    self.state = None
+
+    def stop(self):
+        # run() returns once the sweep in progress is done
+        self.scheduler.stop()
+
+    def sweep_range(self, part, parts):
+        # register [start, stop) of the chunks swept in this part of a pass
+        size = (len(self.index_prefix_mapping) + 1) // 2
+        chunks = -(-size // self.chunk_size)
+        start = chunks * part // parts * self.chunk_size
+        stop = chunks * (part + 1) // parts * self.chunk_size
+        return start, min(stop, size)
+
+    def sweep(self, timer, part=0, parts=1):
+        logging.info('Starting collecting values...')
+        size = len(self.index_prefix_mapping)
+        start, stop = self.sweep_range(part, parts)
+
+        # pipelined sweep: a reader thread fetches chunk k+1 while chunk k
+        # is processed here and the writes of chunk k-1 are in flight
+        chunks = queue.Queue(maxsize=2)
+        reader = threading.Thread(target=self._read_flag_chunks, name='flag reader', daemon=True,
+                                  args=(chunks, start, stop, size))
+        reader.start()
+
+        global_tables = (self.global_table0, self.global_table1)
+        flag_tables = (self.flag_table0, self.flag_table1)
+        counters = self.counters.draft()
+        activated = []
+        deactivated = []
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            writes = []
+            while True:
+                with timer.phase('read'):
+                    chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                with timer.phase('process'):
+                    chunk_start, active = chunk
+                    sweep = self.counters.sweep(active, chunk_start, counters)
+                    # the data plane sets global_table along with the flag, but
+                    # a 0 written for a packet that arrived after the read
+                    # overwrites it, so addresses that became active get 1 again
+                    writes.append(writer.submit(self.write_halves, global_tables,
+                                                sweep.global_indices, sweep.inactive_indices))
+                    # only the flags read as set are cleared: a flag set
+                    # since the Sync is kept for the next sweep
+                    writes.append(writer.submit(self.write_halves, flag_tables,
+                                                [], sweep.flag_indices))
+                    for address in self.index_prefix_mapping.addresses(sweep.global_indices):
+                        logging.warning(f'Prefix {format_address(address)} became active.')
+                    activated.append(sweep.global_indices)
+                    deactivated.append(sweep.inactive_indices)
+            with timer.phase('write'):
+                # surface write errors
+                for write in writes:
+                    write.result()
+
+        with timer.phase('process'):
+            self.counters.publish(counters)
+            self.inactive_cache.update(np.concatenate(activated) if activated else [],
+                                       np.concatenate(deactivated) if deactivated else [])
+            # dark addresses of the whole table, not only of this part
+            dark = self.counters.dark()
+            dark = dark[self.index_prefix_mapping.mapped(dark)]
+            inactive_addr = len(dark)
+            # inactive addresses per dark meter
+            dark_counts = np.bincount(self.index_prefix_mapping.dark_indices(dark),
+                                      minlength=len(self.dark_index_prefix_mapping))
+
+        if self.state is not None:
+            with timer.phase('persist'):
+                self.state.save(self.counters.snapshot(), self.inactive_cache.generation)
+
+        with timer.phase('meters'):
+            self.update_rates(dark_counts, inactive_addr)
 
 '''
 
@@ -0,0 +1,61 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import numpy as np
+
+
+class MeterState:
+    # Last CIR/PIR programmed for every dark_meter index, so that each
+    # interval only pushes the meters whose rate actually moved.
+    def __init__(self, size, tolerance=0.0):
+        self.tolerance = tolerance
+        self.cir = np.zeros(size, dtype=np.int64)
+        self.pir = np.zeros(size, dtype=np.int64)
+        # meters never programmed keep the switch's default configuration
+        self.programmed = np.zeros(size, dtype=bool)
+
+    def changed(self, indices, cir, pir):
+        # mask of the meters whose new rate differs from the programmed one
+        # by more than tolerance (relative to the programmed rate)
+        indices = np.asarray(indices, dtype=np.int64)
+        return (self._moved(self.cir[indices], cir) |
+                self._moved(self.pir[indices], pir))
+
+    def _moved(self, old, new):
+        return np.abs(np.asarray(new) - old) > self.tolerance * old
+
+    def record(self, indices, cir, pir):
+        self.cir[indices] = cir
+        self.pir[indices] = pir
+        self.programmed[indices] = True
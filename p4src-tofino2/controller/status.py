@@ -0,0 +1,125 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+import ipaddress
+import socket
+import numpy as np
+from prefixes import overlapping
+
+# Point and bulk lookups of the state of addresses and prefixes in one
+# published generation. An address is
+#   unmonitored  outside every monitored block
+#   dark         counter 0, no traffic for alpha intervals
+#   active       counter alpha+1, traffic in the last interval
+#   aging        anything in between; remaining is the number of intervals
+#                without traffic before it turns dark
+# A prefix gets the number of its addresses in each state, and the state
+# they share or 'mixed'.
+UNMONITORED, DARK, AGING, ACTIVE = range(4)
+STATES = ('unmonitored', 'dark', 'aging', 'active')
+MAX_ITEMS = 65536
+
+
+def parse_items(items):
+    # addresses as ints and prefixes as IPv4Network, keyed by their position
+    # in items; raises ValueError naming the first item that is neither
+    if not isinstance(items, list) or len(items) > MAX_ITEMS:
+        raise ValueError(f'expected a list of at most {MAX_ITEMS} addresses or prefixes')
+    addresses = {}
+    prefixes = {}
+    for pos, item in enumerate(items):
+        try:
+            if '/' in item:
+                prefixes[pos] = ipaddress.IPv4Network(item, strict=False)
+            else:
+                # inet_pton takes only dotted quads and is much faster than ipaddress
+                addresses[pos] = int.from_bytes(socket.inet_pton(socket.AF_INET, item), 'big')
+        except (TypeError, ValueError, OSError):
+            raise ValueError(f'{item!r} is not an IPv4 address or prefix') from None
+    return addresses, prefixes
+
+
+def address_states(layout, values, alpha, addresses):
+    # vectorized: (state, counter) arrays of int addresses; layout holds the
+    # (networks, base_idxs, sizes) arrays of the blocks sorted by network
+    networks, bases, sizes = layout
+    addresses = np.asarray(addresses, dtype=np.int64)
+    states = np.full(len(addresses), UNMONITORED, dtype=np.int8)
+    counters = np.zeros(len(addresses), dtype=np.int64)
+    if not len(networks) or not len(addresses):
+        return states, counters
+    pos = np.searchsorted(networks, addresses, side='right') - 1
+    offsets = addresses - networks[pos]
+    inside = (pos >= 0) & (offsets < sizes[pos])
+    counters[inside] = values[bases[pos[inside]] + offsets[inside]]
+    states[inside] = np.where(counters[inside] == 0, DARK, np.where(counters[inside] > alpha, ACTIVE, AGING))
+    return states, counters
+
+
+def prefix_counts(layout, values, alpha, net):
+    # number of addresses of net in each state, indexed like STATES
+    networks, bases, sizes = layout
+    low = int(net.network_address)
+    high = low + net.num_addresses
+    counts = [net.num_addresses, 0, 0, 0]
+    first, last = overlapping(layout, low, high)
+    for network, base_idx, size in zip(networks[first:last].tolist(), bases[first:last].tolist(),
+                                       sizes[first:last].tolist()):
+        start, stop = max(low, network), min(high, network + size)
+        block = values[base_idx + start - network:base_idx + stop - network]
+        dark = int(np.count_nonzero(block == 0))
+        active = int(np.count_nonzero(block > alpha))
+        counts[UNMONITORED] -= len(block)
+        counts[DARK] += dark
+        counts[ACTIVE] += active
+        counts[AGING] += len(block) - dark - active
+    return counts
+
+
+def lookup(layout, values, alpha, items):
+    # one result per item, in order
+    addresses, prefixes = parse_items(items)
+    results = [None] * len(items)
+    states, counters = address_states(layout, values, alpha, list(addresses.values()))
+    for pos, state, counter in zip(addresses, states.tolist(), counters.tolist()):
+        results[pos] = {'addr': items[pos], 'state': STATES[state]}
+        if state == AGING:
+            results[pos]['remaining'] = counter
+    for pos, net in prefixes.items():
+        counts = prefix_counts(layout, values, alpha, net)
+        shared = [state for state, count in zip(STATES, counts) if count]
+        results[pos] = {'addr': items[pos], 'state': shared[0] if len(shared) == 1 else 'mixed',
+                        **dict(zip(STATES, counts))}
+    return results
@@ -39,15 +39,18 @@ import time
 import requests
 import netifaces as ni
 from tabulate import tabulate
+from export import decode_runs
+from prefixes import cidr_cover
 
 
 class CLI(cmd.Cmd):
     prompt = 'darknet-detection>>'
     doc_header = 'Available commands:'
 
-    def __init__(self, node_port=2002):
+    def __init__(self, node_port=2002, events_port=2003):
         super(CLI, self).__init__()
         self.port = node_port
+        self.events_port = events_port
         self.addr = socket.gethostbyname(socket.gethostname())
         #self.addr = ni.ifaddresses('eth1')[ni.AF_INET][0]['addr']
 
@@ -68,6 +71,63 @@ class CLI(cmd.Cmd):
             print(x)
         print('-----------------------------')
 
+    def do_status(self, line):
+        """status <address or prefix> [...]
+        Show whether each address is dark, aging, active or unmonitored, or the counts of a prefix."""
+        res = requests.post(f'http://{self.addr}:{self.port}/status', json={'addrs': line.split()})
+        if res.status_code != 200:
+            print(res.json().get('error'))
+            return
+        for x in res.json()['status']:
+            if '/' in x['addr']:
+                print(f"{x['addr']}: {x['state']} (dark {x['dark']}, aging {x['aging']}, active {x['active']}, unmonitored {x['unmonitored']})")
+            elif 'remaining' in x:
+                print(f"{x['addr']}: {x['state']}, dark after {x['remaining']} idle intervals")
+            else:
+                print(f"{x['addr']}: {x['state']}")
+
+    def do_export(self, line):
+        """export [<file>]
+        Fetch the binary export of the inactive space and print its prefixes, or write them to <file>."""
+        res = requests.get(f'http://{self.addr}:{self.port}/export', params={'compression': 'zlib'})
+        generation, starts, ends = decode_runs(res.content)
+        prefixes = cidr_cover(zip(starts.tolist(), ends.tolist()))
+        if line:
+            with open(line.strip(), 'w') as f:
+                f.writelines(f'{prefix}\n' for prefix in prefixes)
+            print(f'Wrote {len(prefixes)} inactive prefixes of generation {generation} to {line.strip()}')
+            return
+        print(f'------Inactive Prefixes (generation {generation})------')
+        for x in prefixes:
+            print(x)
+        print('-----------------------------')
+
+    def do_watch(self, line):
+        """watch
+        Print the prefixes that become active or dark after every sweep, until Ctrl-C."""
+        res = requests.get(f'http://{self.addr}:{self.events_port}/events', stream=True)
+        event = None
+        try:
+            # byte by byte: with the default 512-byte chunks a small event
+            # would wait in the buffer for the ones after it
+            for x in res.iter_lines(chunk_size=1, decode_unicode=True):
+                if x.startswith('event:'):
+                    event = x.split(':', 1)[1].strip()
+                elif x.startswith('data:'):
+                    changes = json.loads(x.split(':', 1)[1])
+                    if event == 'resync':
+                        print(f'------Resync at generation {changes["generation"]}, run inactive------')
+                        continue
+                    print(f'------Generation {changes["generation"]}------')
+                    for prefix in changes['activated']:
+                        print(f'+ {prefix}')
+                    for prefix in changes['deactivated']:
+                        print(f'- {prefix}')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            res.close()
+
     def do_bye(self, line):
         """bye
         Exit client."""
@@ -79,6 +139,7 @@ if __name__ == '__main__':
 
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', default=2002, type=int, help='Your port.')
+    parser.add_argument('-e', '--events-port', default=2003, type=int, help='Port of the change events.')
     args = parser.parse_args()
     port = args.port
-    CLI(port).cmdloop('Darknet detection client! Check your inactive prefixes.')
\ No newline at end of file
+    CLI(port, args.events_port).cmdloop('Darknet detection client! Check your inactive prefixes.')
\ No newline at end of file
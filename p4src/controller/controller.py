@@ -35,11 +35,19 @@
 from p4utils.utils.helper import load_topo
 from p4utils.utils.sswitch_thrift_API import SimpleSwitchThriftAPI
 import argparse
-from radix import Radix
 import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from counters import CounterStore, index_runs
+from prefixes import PrefixMapping, format_address
+from inactive import InactiveCache
+from meters import MeterState
+from allocator import RangeAllocator
+from monitored import MONITORED_TABLE_SIZE, compile_monitored, read_monitored, shared_range
+from scheduler import PhaseTimer, SweepScheduler
+from state import StateFile
 import time
 import ipaddress
-from aggregate6 import aggregate
 import logging
 import math
 
@@ -52,17 +60,29 @@ THRESHOLD = 1024
 
 class LocalClient:
     def __init__(self, time_interval, global_table_size, dark_meter_size, alpha, monitored_path, ports,\
-                max_pkt_rate, max_byte_rate, avg_pkt_rate, avg_byte_rate):
+                max_pkt_rate, max_byte_rate, avg_pkt_rate, avg_byte_rate,
+                meter_tolerance=0.05, overrun_policy='skip', state_path=None):
         self.time_interval = time_interval*60
+        self.scheduler = SweepScheduler(self.time_interval, overrun_policy)
         self.global_table_size = global_table_size
         self.dark_meter_size = dark_meter_size
         self.alpha = alpha
-        self.counters = [self.alpha]*self.global_table_size
+        self.counters = CounterStore(self.global_table_size, self.alpha)
         self.monitored_path = monitored_path
-        self.index_prefix_mapping = []
-        self.prefix_index_mapping = Radix()
-        self.dark_prefix_index_mapping = dict()
+        self.index_prefix_mapping = PrefixMapping()
+        self.inactive_cache = InactiveCache(self.index_prefix_mapping, self.counters)
+        self.dark_index_prefix_mapping = np.empty(0, dtype=np.int64)
         self.ports = ports
+        # dark_meter rates already on the switches; changes within tolerance are not pushed
+        self.meter_state = MeterState(dark_meter_size, meter_tolerance)
+        # optional mmap-backed counters, resumed across restarts
+        self.state_path = state_path
+        self.state = None
+        # free ranges of global_table and dark_meter; sweeps and changes of
+        # the monitored layout hold layout_lock
+        self.index_allocator = RangeAllocator(self.global_table_size)
+        self.dark_allocator = RangeAllocator(self.dark_meter_size)
+        self.layout_lock = threading.Lock()
 
         self.max_pkt_rate = max_pkt_rate
         self.max_byte_rate = max_byte_rate
@@ -75,167 +95,471 @@ class LocalClient:
         self.avg_byte_rate_addr = round(self.avg_byte_rate / self.global_table_size, 3)
 
         self.controllers = dict()
-        self.lock = threading.Lock()
         self.topo = None
         self._setup()
 
     def _setup(self):
-        self.topo = load_topo('../topology.json')        
-        # load controllers for all switches
-        for p4switch in self.topo.get_p4switches():
-            thrift_port = self.topo.get_thrift_port(p4switch)
-            self.controllers[p4switch] = SimpleSwitchThriftAPI(thrift_port)
+        timer = PhaseTimer()
+        with timer.phase('connect'):
+            self.topo = load_topo('../topology.json')
+            # load controllers for all switches
+            for p4switch in self.topo.get_p4switches():
+                thrift_port = self.topo.get_thrift_port(p4switch)
+                self.controllers[p4switch] = SimpleSwitchThriftAPI(thrift_port)
 
+        # each switch has its own Thrift connection, so the switches are
+        # programmed concurrently
+        with timer.phase('registers'):
+            self.on_switches(self.reset_registers)
+            # entries left by a previous run would keep its layout
+            self.on_switches(self.clear_tables)
+        with timer.phase('mirroring'):
+            self.add_mirroring(100, 200)
+        with timer.phase('monitored'):
+            monitored_prefixes = self._read_monitored_prefixes(self.monitored_path)
+            self.populate_monitored(monitored_prefixes)
+        with timer.phase('state'):
+            generation = self.resume_state() if self.state_path else None
+            self.inactive_cache.rebuild(generation)
+        with timer.phase('ports'):
+            self.add_ports(self.ports)
+        with timer.phase('meters'):
+            self.set_rates()
+        logging.info(f'Startup took {timer.total():.3f} secs ({timer})')
+
+    def on_switches(self, func, *args):
+        # run func(sw, controller, *args) for every switch at once
+        with ThreadPoolExecutor(max_workers=len(self.controllers)) as pool:
+            results = [pool.submit(func, sw, controller, *args) for sw, controller in self.controllers.items()]
+            for result in results:
+                result.result()
+
+    def clear_tables(self, sw, controller):
+        for table in ('MyIngress.monitored', 'MyIngress.ports'):
+            controller.table_clear(table)
+
+    def reset_registers(self, sw, controller):
         # set initial values of registers
-        for sw, controller in self.controllers.items():
-            print("Setting registers for switch {}".format(sw))
-            for register in controller.get_register_arrays():
-                if register == 'MyIngress.global_table':
-                    controller.register_write(register, [0, self.global_table_size - 1], 1)
-                else:
-                    controller.register_reset(register)
-        self.add_mirroring(100, 200)
-        monitored_prefixes = self._read_monitored_prefixes(self.monitored_path)
-        self.populate_monitored(monitored_prefixes)
-        self.add_ports(self.ports)
-        self.set_rates()
+        print("Setting registers for switch {}".format(sw))
+        for register in controller.get_register_arrays():
+            if register == 'MyIngress.global_table':
+                controller.register_write(register, [0, self.global_table_size - 1], 1)
+            else:
+                controller.register_reset(register)
+
+    def resume_state(self):
+        # resume the saved counters of the prefixes still monitored, wherever
+        # they are placed now, and bring global_table in line with them
+        self.state = StateFile(self.state_path, self.index_prefix_mapping)
+        values = self.counters.draft()
+        generation = self.state.open(values)
+        if generation is None:
+            logging.info(f'No state to resume in {self.state_path}, starting from alpha')
+            return None
+        # a smaller alpha than last run only shortens the remaining lifetimes
+        np.minimum(values, self.alpha + 1, out=values)
+        self.counters.publish(values)
+        size = len(self.index_prefix_mapping)
+        # global_table was just set to 1 everywhere, so only the dark runs
+        # are written back, as ranges
+        runs = index_runs(self.counters.dark(0, size))
+        for controller in self.controllers.values():
+            self.write_runs(controller, 'MyIngress.global_table', runs, 0)
+        logging.info(f'Resumed counters of generation {generation} from {self.state_path}')
+        return generation
 
     def set_rates(self):
+        self.on_switches(self._set_global_rate)
+        self.set_dark_rates(np.flatnonzero(self.dark_index_prefix_mapping >= 0))
+
+    def _set_global_rate(self, sw, controller):
         # set global rate
-        for controller in self.controllers.values():
-            controller.meter_set_rates('MyIngress.dark_global_meter', 0, [(self.avg_pkt_rate, 100), (self.max_pkt_rate, 100)])
+        controller.meter_set_rates('MyIngress.dark_global_meter', 0, [(self.avg_pkt_rate, 100), (self.max_pkt_rate, 100)])
 
-        # only for packet rate for now
+    def set_dark_rates(self, indices):
+        # initial per-/24 rate of the given dark meters, only for packet rate for now
         prefix_max_pkt_rate = math.ceil(self.max_pkt_rate_addr * 256) # per /24
         prefix_avg_pkt_rate = math.ceil(self.avg_pkt_rate_addr * 256) # per /24
 
-        for controller in self.controllers.values():
-            for i in range(len(self.dark_prefix_index_mapping)):
-                controller.meter_set_rates('MyIngress.dark_meter', i, [(prefix_avg_pkt_rate, 100), (prefix_max_pkt_rate, 100)])
-    
-    def update_rates(self, inactive_pfxs, inactive_addr):
+        indices = np.asarray(indices, dtype=np.int64)
+        self.program_dark_meters(indices, np.full(len(indices), prefix_avg_pkt_rate),
+                                 np.full(len(indices), prefix_max_pkt_rate))
+
+    def program_dark_meters(self, indices, cir, pir):
+        # per-index rates on every switch, then recorded in meter_state
+        self.on_switches(self._set_dark_rates, np.asarray(indices).tolist(),
+                         np.asarray(cir).tolist(), np.asarray(pir).tolist())
+        self.meter_state.record(indices, cir, pir)
+
+    def _set_dark_rates(self, sw, controller, indices, cir, pir):
+        for idx, avg_rate, max_rate in zip(indices, cir, pir):
+            controller.meter_set_rates('MyIngress.dark_meter', idx, [(avg_rate, 100), (max_rate, 100)])
+
+    def update_rates(self, dark_counts, inactive_addr):
+        if not inactive_addr:
+            # nothing is dark, so no dark meter is in use
+            return
         addr_avg_pkt_rate = math.ceil(self.avg_pkt_rate / inactive_addr) # per /24
         addr_max_pkt_rate = math.ceil(self.max_pkt_rate / inactive_addr) # per /24
 
-        for inactive_pfx, in_addr in inactive_pfxs.items():
-            prefix_max_pkt_rate = math.ceil(addr_max_pkt_rate * in_addr) # per /24
-            prefix_avg_pkt_rate = math.ceil(addr_avg_pkt_rate * in_addr) # per /24
-            idx = self.dark_prefix_index_mapping[inactive_pfx]
+        # dark_counts holds the number of inactive addresses per dark meter
+        indices = np.flatnonzero(dark_counts)
+        in_addr = dark_counts[indices]
+        prefix_max_pkt_rate = addr_max_pkt_rate * in_addr # per /24
+        prefix_avg_pkt_rate = addr_avg_pkt_rate * in_addr # per /24
 
-            for controller in self.controllers.values():
-                controller.meter_set_rates('MyIngress.dark_meter', idx, [(prefix_avg_pkt_rate, 100), (prefix_max_pkt_rate, 100)])
+        # only push the meters whose rate moved beyond the tolerance
+        changed = self.meter_state.changed(indices, prefix_avg_pkt_rate, prefix_max_pkt_rate)
+        indices = indices[changed]
+        self.program_dark_meters(indices, prefix_avg_pkt_rate[changed], prefix_max_pkt_rate[changed])
+        logging.info(f'Updated {len(indices)} of {np.count_nonzero(dark_counts)} dark meters')
 
     def add_ports(self, ports):
+        self.on_switches(self._add_ports, ports)
+
+    def _add_ports(self, sw, controller, ports):
         for port in ports['incoming']:
-            for controller in self.controllers.values():
-                controller.table_add('MyIngress.ports', 'set_incoming', [str(port)], [])
+            controller.table_add('MyIngress.ports', 'set_incoming', [str(port)], [])
         for port in ports['outgoing']:
-            for controller in self.controllers.values():
-                controller.table_add('MyIngress.ports', 'set_outgoing', [str(port)], [])
+            controller.table_add('MyIngress.ports', 'set_outgoing', [str(port)], [])
 
     def populate_monitored(self, entries):
-        base_idx = 0
-        dark_base_idx = 0
-        for entry in entries:
-            length = entry.split('/')[-1]
-            for controller in self.controllers.values():
-                controller.table_add('MyIngress.monitored', 'calc_idx', [entry], action_params=[str(base_idx), length, str(dark_base_idx)])            # save in local dictionary
-            ipnet = ipaddress.IPv4Network(entry)
-            netws = list(ipnet.subnets(new_prefix=32))
-            self.index_prefix_mapping.extend(netws)
-
-            for i in range(len(netws)):
-                node = self.prefix_index_mapping.add(str(netws[i]))
-                node.data['index'] = base_idx + i
-
-            dark_netws = list(ipnet.subnets(new_prefix=24))
-            for i in range(len(dark_netws)):
-                dark_netw = '.'.join(str(dark_netws[i]).split('.')[:3])
-                self.dark_prefix_index_mapping[dark_netw] = dark_base_idx + i            
-
-            base_idx += len(netws)
-            dark_base_idx += len(dark_netws)
+        self.index_allocator.reset()
+        self.dark_allocator.reset()
+        self.dark_index_prefix_mapping = np.full(self.dark_meter_size, -1, dtype=np.int64)
+        self.add_monitored(entries)
+        logging.info(f'Index space: {self.get_utilization()}')
+
+    def monitored_row(self, ipnet, base_idx, dark_base_idx):
+        return str(ipnet), [str(base_idx), str(ipnet.prefixlen), str(dark_base_idx)]
+
+    def add_monitored(self, entries):
+        rows = [self.monitored_row(*block) for block in self.place_monitored(entries)]
+        self.on_switches(self._add_monitored, rows)
+
+    def place_monitored(self, entries):
+        # allocate ranges for the prefixes, largest first so that blocks pack
+        # without holes; returns (ipnet, base_idx, dark_base_idx) per block
+        nets = sorted((ipaddress.IPv4Network(entry) for entry in entries), key=lambda net: net.prefixlen)
+        if not self.index_allocator.fits([net.num_addresses for net in nets]) or \
+                not self.dark_allocator.fits([2**max(24 - net.prefixlen, 0) for net in nets]):
+            raise ValueError(f'{len(nets)} prefixes do not fit in the free global_table and dark_meter ranges')
+        blocks = []
+        for ipnet in nets:
+            # dark meters are per /24: dark_meter index -> /24 network (address >> 8)
+            num_dark = 2**max(24 - ipnet.prefixlen, 0)
+            base_idx = self.index_allocator.allocate(ipnet.num_addresses)
+            dark_base_idx = self.dark_allocator.allocate(num_dark)
+            # save in local dictionary
+            self.index_prefix_mapping.add(ipnet, base_idx, dark_base_idx)
+            network = int(ipnet.network_address)
+            self.dark_index_prefix_mapping[dark_base_idx:dark_base_idx + num_dark] = \
+                np.arange(network >> 8, (network >> 8) + num_dark)
+            blocks.append((ipnet, base_idx, dark_base_idx))
+        return blocks
+
+    def _add_monitored(self, sw, controller, rows):
+        for entry, action_params in rows:
+            controller.table_add('MyIngress.monitored', 'calc_idx', [entry], action_params=action_params)
+
+    def _modify_monitored(self, sw, controller, rows):
+        for entry, action_params in rows:
+            controller.table_modify_match('MyIngress.monitored', 'calc_idx', [entry], action_params=action_params)
+
+    def _delete_monitored(self, sw, controller, prefixes):
+        for prefix in prefixes:
+            controller.table_delete_match('MyIngress.monitored', [prefix])
+
+    def _reset_ranges(self, sw, controller, freed, new):
+        # with their entries gone no new flag can appear in the freed ranges;
+        # new ranges start as after _setup
+        self.write_runs(controller, 'MyIngress.flag_table', freed + new, 0)
+        self.write_runs(controller, 'MyIngress.global_table', freed, 0)
+        self.write_runs(controller, 'MyIngress.global_table', new, 1)
+
+    def _write_global(self, sw, controller, live, dark, flagged):
+        self.write_runs(controller, 'MyIngress.global_table', live, 1)
+        self.write_runs(controller, 'MyIngress.global_table', dark, 0)
+        self.write_runs(controller, 'MyIngress.flag_table', flagged, 1)
+
+    def _move_ranges(self, sw, controller, live, dark, flagged, unflagged, rows, left):
+        # registers of the new ranges first, then the entries pointing at
+        # them, then whatever the old ranges leave behind
+        self.write_runs(controller, 'MyIngress.flag_table', flagged, 1)
+        self.write_runs(controller, 'MyIngress.flag_table', unflagged, 0)
+        self.write_runs(controller, 'MyIngress.global_table', live, 1)
+        self.write_runs(controller, 'MyIngress.global_table', dark, 0)
+        self._modify_monitored(sw, controller, rows)
+        self.write_runs(controller, 'MyIngress.flag_table', left, 0)
+        self.write_runs(controller, 'MyIngress.global_table', left, 0)
+
+    def reload_monitored(self, path=None):
+        # re-read the monitored list and apply only the difference: removed
+        # prefixes lose their entries and free their ranges, added ones are
+        # placed in free global_table and dark_meter ranges (compacting the
+        # live blocks if the free space is too fragmented), and the counters
+        # of unchanged prefixes carry over
+        entries = self._read_monitored_prefixes(path or self.monitored_path)
+        with self.layout_lock:
+            current = self.index_prefix_mapping.prefixes()
+            removed = [prefix for prefix in current if prefix not in entries]
+            added = [entry for entry in entries if entry not in current]
+
+            # refuse the whole reload if the added prefixes do not fit even
+            # once the removed ones are freed and the rest compacted
+            old_nets = [ipaddress.IPv4Network(prefix) for prefix in removed]
+            nets = [ipaddress.IPv4Network(entry) for entry in added]
+            needed = sum(net.num_addresses for net in nets)
+            needed_dark = sum(2**max(24 - net.prefixlen, 0) for net in nets)
+            if needed > self.index_allocator.free + sum(net.num_addresses for net in old_nets) or \
+                    needed_dark > self.dark_allocator.free + sum(2**max(24 - net.prefixlen, 0) for net in old_nets):
+                raise ValueError(f'{len(added)} added prefixes need {needed} global_table and '
+                                 f'{needed_dark} dark_meter entries, more than are free')
+
+            counters = self.counters.draft()
+            carried = []
+            freed = []
+            for net in old_nets:
+                base_idx, dark_base_idx = self.index_prefix_mapping.remove(net)
+                num_dark = 2**max(24 - net.prefixlen, 0)
+                # unused ranges hold 0, which never ages, so they cost no writes
+                carried.append((net, counters[base_idx:base_idx + net.num_addresses].copy()))
+                counters[base_idx:base_idx + net.num_addresses] = 0
+                freed.append((base_idx, base_idx + net.num_addresses - 1))
+                self.index_allocator.release(base_idx, net.num_addresses)
+                self.dark_allocator.release(dark_base_idx, num_dark)
+                self.dark_index_prefix_mapping[dark_base_idx:dark_base_idx + num_dark] = -1
+            self.on_switches(self._delete_monitored, removed)
+            # with the entries gone no new flag can appear in the freed ranges;
+            # read the flags set on any switch since the last sweep before clearing them
+            if freed:
+                with ThreadPoolExecutor(max_workers=len(self.controllers)) as pool:
+                    flags = np.bitwise_or.reduce(list(pool.map(self.read_flags, self.controllers.values()))) > 0
+                carried = [(net, values, flags[first:last + 1]) for (net, values), (first, last) in zip(carried, freed)]
+            self.on_switches(self._reset_ranges, freed, [])
+
+            if not self.index_allocator.fits(sorted((net.num_addresses for net in nets), reverse=True)) or \
+                    not self.dark_allocator.fits(sorted((2**max(24 - net.prefixlen, 0) for net in nets), reverse=True)):
+                counters = self.compact(counters)
+            blocks = self.place_monitored(added)
+            new = [(base_idx, base_idx + net.num_addresses - 1) for net, base_idx, _ in blocks]
+            # start the new ranges from scratch before their entries exist
+            self.on_switches(self._reset_ranges, [], new)
+            for first, last in new:
+                counters[first:last + 1] = self.alpha
+            # where added prefixes merge or split removed ones, the shared
+            # addresses keep their counters and global_table state
+            kept = []
+            kept_flags = []
+            for old_net, old_values, old_flags in carried:
+                for net, base_idx, _ in blocks:
+                    shared = shared_range(old_net, net)
+                    if shared is not None:
+                        old_offset, offset, length = shared
+                        counters[base_idx + offset:base_idx + offset + length] = old_values[old_offset:old_offset + length]
+                        kept.append(np.arange(base_idx + offset, base_idx + offset + length))
+                        kept_flags.append(old_flags[old_offset:old_offset + length])
+            if kept:
+                # the flags set since the last sweep move with their addresses;
+                # a flagged address holds global_table 1 even when its counter is 0
+                order = np.argsort(np.concatenate(kept))
+                kept = np.concatenate(kept)[order]
+                flagged = np.concatenate(kept_flags)[order]
+                live = (counters[kept] > 0) | flagged
+                self.on_switches(self._write_global, index_runs(kept[live]), index_runs(kept[~live]),
+                                 index_runs(kept[flagged]))
+            self.on_switches(self._add_monitored, [self.monitored_row(*block) for block in blocks])
+            self.set_dark_rates([dark_base_idx + i for net, _, dark_base_idx in blocks
+                                 for i in range(2**max(24 - net.prefixlen, 0))])
+
+            self.counters.publish(counters)
+            self.inactive_cache.rebuild()
+            if self.state is not None:
+                self.state.save(self.counters.snapshot(), self.inactive_cache.generation)
+
+        logging.info(f'Reloaded monitored prefixes: {len(added)} added, {len(removed)} removed, '
+                     f'{len(current) - len(removed)} unchanged; index space: {self.get_utilization()}')
+        return {'added': added, 'removed': removed, 'unchanged': len(current) - len(removed)}
+
+    def compact(self, values):
+        # slide the live blocks to the bottom of global_table and dark_meter so
+        # that the free space becomes one range; returns the moved counters.
+        # Traffic in the few ms between reading the old flags and updating the
+        # entries may be credited to the wrong address once.
+        blocks = [(ipaddress.IPv4Network(prefix), base_idx, dark_base_idx)
+                  for prefix, (base_idx, dark_base_idx) in self.index_prefix_mapping.prefixes().items()]
+        bases = self.index_allocator.compact([(base_idx, net.num_addresses) for net, base_idx, _ in blocks])
+        dark_bases = self.dark_allocator.compact([(dark_base_idx, 2**max(24 - net.prefixlen, 0))
+                                                  for net, _, dark_base_idx in blocks])
+        moves = [(net, base_idx, new_base_idx, dark_base_idx, new_dark_base_idx)
+                 for (net, base_idx, dark_base_idx), new_base_idx, new_dark_base_idx in zip(blocks, bases, dark_bases)
+                 if (base_idx, dark_base_idx) != (new_base_idx, new_dark_base_idx)]
+        if not moves:
+            return values
+        old = np.concatenate([np.arange(base_idx, base_idx + net.num_addresses) for net, base_idx, _, _, _ in moves])
+        new = np.concatenate([np.arange(base_idx, base_idx + net.num_addresses) for net, _, base_idx, _, _ in moves])
+        old_dark = np.concatenate([np.arange(base_idx, base_idx + 2**max(24 - net.prefixlen, 0)) for net, _, _, base_idx, _ in moves])
+        new_dark = np.concatenate([np.arange(base_idx, base_idx + 2**max(24 - net.prefixlen, 0)) for net, _, _, _, base_idx in moves])
+
+        # the flags set on any switch since the last sweep move with their
+        # addresses, so the next sweep sees the activity as if the blocks had not moved
+        with ThreadPoolExecutor(max_workers=len(self.controllers)) as pool:
+            flags = np.bitwise_or.reduce(list(pool.map(self.read_flags, self.controllers.values())))
+        active = flags[old] > 0
+        moved = values.copy()
+        moved[old] = 0
+        moved[new] = values[old]
+
+        # only meters programmed before carry a rate over
+        programmed = self.meter_state.programmed[old_dark]
+        self.program_dark_meters(new_dark[programmed], self.meter_state.cir[old_dark[programmed]],
+                                 self.meter_state.pir[old_dark[programmed]])
+        # a flagged address holds global_table 1 even when its counter is 0
+        live = (moved[new] > 0) | active
+        rows = [self.monitored_row(net, base_idx, dark_base_idx) for net, _, base_idx, _, dark_base_idx in moves]
+        self.on_switches(self._move_ranges, index_runs(np.sort(new[live])), index_runs(np.sort(new[~live])),
+                         index_runs(np.sort(new[active])), index_runs(np.sort(new[~active])),
+                         rows, index_runs(np.setdiff1d(old, new)))
+
+        dark_prefixes = self.dark_index_prefix_mapping.copy()
+        self.dark_index_prefix_mapping[old_dark] = -1
+        self.dark_index_prefix_mapping[new_dark] = dark_prefixes[old_dark]
+        for net, _, base_idx, _, dark_base_idx in moves:
+            self.index_prefix_mapping.remove(net)
+            self.index_prefix_mapping.add(net, base_idx, dark_base_idx)
+        logging.info(f'Compacted {len(moves)} monitored blocks ({len(old)} addresses moved)')
+        return moved
+
+    def get_utilization(self):
+        monitored = len(self.index_prefix_mapping.prefixes())
+        return {'monitored': {'size': MONITORED_TABLE_SIZE, 'used': monitored, 'free': MONITORED_TABLE_SIZE - monitored},
+                'global_table': self.index_allocator.report(), 'dark_meter': self.dark_allocator.report()}
 
     def _read_monitored_prefixes(self, path):
-        monitored_prefixes = []
-        with open(path, 'r') as f:
-            for line in f:
-                if line.startswith('#'):
-                    continue
-                monitored_prefixes.append(line)
-        return monitored_prefixes
+        # the monitored file compiled into the prefixes to program
+        prefixes, footprint = compile_monitored(read_monitored(path))
+        registers = sum(ipaddress.IPv4Network(prefix).num_addresses for prefix in prefixes)
+        logging.info(f'Monitored prefixes from {path}: {footprint["lines"]} listed, {footprint["duplicates"]} duplicate, '
+                     f'{footprint["merged"]} merged into neighbours; {footprint["entries"]}/{footprint["table_size"]} monitored, '
+                     f'{registers}/{self.global_table_size} global_table and '
+                     f'{footprint["dark_meters"]}/{self.dark_meter_size} dark_meter entries')
+        return prefixes
 
     def add_mirroring(self, mc_session_id, log_session_id):
+        self.on_switches(self._add_mirroring, mc_session_id, log_session_id)
+
+    def _add_mirroring(self, sw, controller, mc_session_id, log_session_id):
         mc_grp_id = 1
-        for sw, controller in self.controllers.items():
-            rid = 1
-            controller.mc_mgrp_create(mc_grp_id)
-            for sw1 in self.controllers:
-                if sw == sw1:
-                    continue
-                s_ip_addr, s_mac_addr = self.topo.node_to_node_interface_ip(sw1, sw), self.topo.node_to_node_mac(sw1, sw)
-                for i in range(3):
-                    handle = controller.mc_node_create(rid, [self.topo.node_to_node_port_num(sw, sw1)])
-                    controller.mc_node_associate(mc_grp_id, handle)
-                    controller.table_add("mcast_routers", "set_nhop_r", [str(rid)], [str(s_mac_addr), str(s_ip_addr)])
-                    rid += 1
-            controller.mirroring_add_mc(mc_session_id, mc_grp_id)
-            controller.mirroring_add(log_session_id, LOG_PORT)
-     
+        rid = 1
+        controller.mc_mgrp_create(mc_grp_id)
+        for sw1 in self.controllers:
+            if sw == sw1:
+                continue
+            s_ip_addr, s_mac_addr = self.topo.node_to_node_interface_ip(sw1, sw), self.topo.node_to_node_mac(sw1, sw)
+            for i in range(3):
+                handle = controller.mc_node_create(rid, [self.topo.node_to_node_port_num(sw, sw1)])
+                controller.mc_node_associate(mc_grp_id, handle)
+                controller.table_add("mcast_routers", "set_nhop_r", [str(rid)], [str(s_mac_addr), str(s_ip_addr)])
+                rid += 1
+        controller.mirroring_add_mc(mc_session_id, mc_grp_id)
+        controller.mirroring_add(log_session_id, LOG_PORT)
+
     def get_inactive_prefixes(self, covering_prefix=None):
-        inactive_prefixes = []
-        with self.lock:
-            if covering_prefix is None:
-                for i in range(len(self.index_prefix_mapping)):
-                    if not self.counters[i]:
-                        inactive_prefixes.append(str(self.index_prefix_mapping[i]))
+        # served from the cache refreshed by every sweep
+        return self.inactive_cache.get(covering_prefix)
+
+    def get_changes(self, since, epoch=None):
+        return self.inactive_cache.changes(since, epoch)
+
+    def add_listener(self, callback):
+        # callback() runs in the sweep thread after every published generation
+        self.inactive_cache.listeners.append(callback)
+
+    def get_inactive_snapshot(self):
+        # the published InactiveSnapshot, for answers that must come from one generation
+        return self.inactive_cache.snapshot
+
+    def read_flags(self, controller):
+        # whole flag_table of one switch in a single Thrift call
+        return np.array(controller.register_read('MyIngress.flag_table'), dtype=np.uint8)
+
+    def write_runs(self, controller, register, runs, value):
+        # one call per run of adjacent indices
+        for first, last in runs:
+            if first == last:
+                controller.register_write(register, first, value)
             else:
-                covered = self.prefix_index_mapping.search_covered(covering_prefix)
-                for node in covered:
-                    if not self.counters[node.data['index']]:
-                        inactive_prefixes.append(str(node.prefix))
-        
-            return aggregate(inactive_prefixes)
-        
+                controller.register_write(register, [first, last], value)
+
+    def write_back(self, controller, flags, sweep, start=0):
+        # the data plane sets global_table together with the flag, but a 0
+        # written for a packet that arrived after the read overwrites it, so
+        # addresses that became active get 1 again. flags covers [start, start+len(flags))
+        self.write_runs(controller, 'MyIngress.global_table', index_runs(sweep.global_indices), 1)
+        self.write_runs(controller, 'MyIngress.global_table', index_runs(sweep.inactive_indices), 0)
+
+        # only the flags read as set are cleared: a flag set since the read
+        # is kept for the next sweep
+        flagged = np.flatnonzero(flags) + start
+        self.write_runs(controller, 'MyIngress.flag_table', index_runs(flagged), 0)
+
     def run(self):
-        while True:
-            logging.info('Starting collecting values...')
-            # collect global table(s)
-            inactive_pfxs = dict()
-            inactive_addr = 0
-            for i in range(len(self.index_prefix_mapping)):
-                active = 0
-                for controller in self.controllers.values():
-                    t_val = controller.register_read('MyIngress.flag_table', i)
-                    active |= t_val
-                with self.lock:
-                    if active:
-                        for controller in self.controllers.values():
-                            if not self.counters[i]:
-                                controller.register_write('MyIngress.global_table', i , 1)
-                            controller.register_write('MyIngress.flag_table', i, 0)
-                        logging.warning(f'Prefix {self.index_prefix_mapping[i]} became active.')
-                        self.counters[i] = self.alpha + 1
-                    else:
-                        if self.counters[i] > 1:
-                            self.counters[i] -= 1
-                        else:
-                            inactive_addr += 1
-                            pfx = ".".join(str(self.index_prefix_mapping[i]).split(".")[:3])
-                            if pfx not in inactive_pfxs:
-                                inactive_pfxs[pfx] = 0
-                            inactive_pfxs[pfx] += 1
-
-                            if self.counters[i] == 1:
-                                for controller in self.controllers.values():
-                                    controller.register_write('MyIngress.global_table', i, 0)
-                                self.counters[i] = 0
-
-            self.update_rates(inactive_pfxs, inactive_addr)
-
-            logging.info(f'Waiting for {self.time_interval/60} mins...')
-            time.sleep(self.time_interval)
+        with ThreadPoolExecutor(max_workers=len(self.controllers)) as pool:
+            def sweep(timer, part, parts):
+                with self.layout_lock:
+                    self.sweep(pool, timer, part, parts)
+            try:
+                self.scheduler.run(sweep)
+            finally:
+                with self.layout_lock:
+                    if self.state is not None:
+                        self.state.close()
+                        self.state = None
+
+    def stop(self):
+        # run() returns once the sweep in progress is done
+        self.scheduler.stop()
+
+    def sweep(self, pool, timer, part=0, parts=1):
+        logging.info('Starting collecting values...')
+        size = len(self.index_prefix_mapping)
+        # a split pass sweeps a contiguous slice per interval
+        start, stop = size * part // parts, size * (part + 1) // parts
+
+        # fetch every switch's flag_table concurrently and OR them together
+        with timer.phase('read'):
+            switch_flags = [flags[start:stop] for flags in pool.map(self.read_flags, self.controllers.values())]
+        with timer.phase('process'):
+            active = np.zeros(stop - start, dtype=bool)
+            for flags in switch_flags:
+                active |= flags.astype(bool)
+            sweep = self.counters.sweep(active, start)
+
+        # fan the range-coalesced write-back out across switches
+        with timer.phase('write'):
+            results = [pool.submit(self.write_back, controller, flags, sweep, start)
+                       for controller, flags in zip(self.controllers.values(), switch_flags)]
+            for result in results:
+                result.result()
+
+        with timer.phase('process'):
+            for address in self.index_prefix_mapping.addresses(sweep.global_indices):
+                logging.warning(f'Prefix {format_address(address)} became active.')
+            self.inactive_cache.update(sweep.global_indices, sweep.inactive_indices)
+            # dark addresses of the whole table, not only of this part
+            dark = self.counters.dark()
+            dark = dark[self.index_prefix_mapping.mapped(dark)]
+            inactive_addr = len(dark)
+            # inactive addresses per dark meter
+            dark_counts = np.bincount(self.index_prefix_mapping.dark_indices(dark),
+                                      minlength=len(self.dark_index_prefix_mapping))
+
+        if self.state is not None:
+            with timer.phase('persist'):
+                self.state.save(self.counters.snapshot(), self.inactive_cache.generation)
 
+        with timer.phase('meters'):
+            self.update_rates(dark_counts, inactive_addr)
 
 '''
 
@@ -0,0 +1,117 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import numpy as np
+from collections import namedtuple
+
+# largest alpha that still fits alpha+1 in a counter cell
+MAX_ALPHA = np.iinfo(np.uint8).max - 1
+
+# outcome of one sweep, as index arrays into the counter store:
+#   global_indices   - dark addresses that became active (global_table <- 1)
+#   flag_indices     - addresses flagged active this interval (flag_table <- 0)
+#   inactive_indices - addresses that became dark (global_table <- 0)
+SweepResult = namedtuple('SweepResult', ['global_indices', 'flag_indices', 'inactive_indices'])
+
+
+def index_runs(indices):
+    # coalesce sorted indices into inclusive (first, last) runs for range writes
+    indices = np.asarray(indices, dtype=np.int64)
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    firsts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    lasts = np.concatenate((indices[breaks], [indices[-1]]))
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+class CounterStore:
+    # Per-address activity counters kept in a single uint8 array.
+    # An address seen active is set to alpha+1, every interval without
+    # activity decrements it and it is dark once it reaches 0.
+    # The published array is read-only: a sweep works on a private draft and
+    # publishes it with a single assignment, so readers never need a lock and
+    # can keep using the snapshot they took for a whole request.
+    def __init__(self, size, alpha):
+        if not 0 < alpha <= MAX_ALPHA:
+            raise ValueError(f'alpha must be in [1, {MAX_ALPHA}], got {alpha}')
+        self.alpha = alpha
+        self.publish(np.full(size, alpha, dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.values)
+
+    def snapshot(self):
+        return self.values
+
+    def draft(self):
+        return self.values.copy()
+
+    def publish(self, values):
+        values.flags.writeable = False
+        self.values = values
+
+    def sweep(self, active, start=0, values=None):
+        # apply one interval of activity flags to the counters at once.
+        # Given a draft, only [start, start+len(active)) of it is swept in
+        # place and the caller publishes it once every chunk is done.
+        draft = self.draft() if values is None else values
+        current = draft[start:start + len(active)]
+        active = np.asarray(active, dtype=bool)
+        idle = ~active
+        global_indices = np.flatnonzero(active & (current == 0))
+        inactive_indices = np.flatnonzero(idle & (current == 1))
+        aging = idle & (current > 1)
+
+        current[active] = self.alpha + 1
+        current[aging] -= 1
+        current[inactive_indices] = 0
+        if values is None:
+            self.publish(draft)
+        return SweepResult(global_indices + start, np.flatnonzero(active) + start, inactive_indices + start)
+
+    def dark(self, start=0, stop=None, values=None):
+        # indices (relative to start) of dark addresses in [start, stop)
+        values = self.values if values is None else values
+        return np.flatnonzero(values[start:stop] == 0)
+
+    def dark_runs(self, start=0, stop=None, values=None):
+        # [starts, ends) index arrays of the runs of dark addresses in [start, stop)
+        values = self.values if values is None else values
+        dark = (values[start:stop] == 0).view(np.int8)
+        edges = np.flatnonzero(np.diff(dark, prepend=0, append=0))
+        return edges[0::2] + start, edges[1::2] + start
+
+    def reset(self):
+        self.publish(np.full(len(self.values), self.alpha, dtype=np.uint8))
@@ -0,0 +1,190 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+
+import asyncio
+import json
+import logging
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+HEARTBEAT = 15        # seconds between comments that keep idle streams alive
+RETRY = 5000          # ms a disconnected EventSource waits before reconnecting
+
+
+class EventServer:
+    # Server-sent events on their own port: GET /events streams the CIDRs
+    # that became active or dark after every sweep. All subscribers are
+    # coroutines on one asyncio loop thread, so they cost no worker thread.
+    # A subscriber only keeps a flag for "new generations published"; when
+    # its socket is ready it gets one delta from the journal covering every
+    # generation it missed, so a slow consumer holds no queue and never
+    # stalls the others. One that cannot take a write for write_timeout
+    # seconds is dropped and can resume with Last-Event-ID.
+    def __init__(self, controller, host, port, max_subscribers=1024, write_timeout=30):
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.max_subscribers = max_subscribers
+        self.write_timeout = write_timeout
+        self.subscribers = set()     # asyncio.Event per subscriber, set on new generations
+        self.connections = set()     # tasks of the open connections
+        self.deltas = dict()         # (since, epoch) -> (generation, encoded event) until the next one
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='events', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+            self.thread.join()
+
+    def notify(self):
+        # called by the sweep thread after it published a generation
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.deltas = dict()
+        for pending in self.subscribers:
+            pending.set()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(f'Serving events on {self.host}:{self.port}')
+        self.ready.set()
+        await self._stop.wait()
+        server.close()
+        for task in self.connections:
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections.add(asyncio.current_task())
+        try:
+            request = await self._read_request(reader, writer)
+            if request is not None:
+                await self._stream(writer, *request)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping
+            pass
+        finally:
+            writer.close()
+            self.connections.discard(asyncio.current_task())
+
+    async def _read_request(self, reader, writer):
+        # (since, epoch) of a GET /events request; answers anything else and returns None
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.write_timeout)
+        lines = head.decode('latin-1').split('\r\n')
+        method, target = (lines[0].split(' ') + ['', ''])[:2]
+        headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+        headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+        url = urlsplit(target)
+        if method != 'GET' or url.path != '/events':
+            await self._respond(writer, '404 Not Found')
+            return None
+        if len(self.subscribers) >= self.max_subscribers:
+            await self._respond(writer, '503 Service Unavailable')
+            return None
+        # resume after Last-Event-ID (epoch-generation) or since=, else
+        # start from the current generation
+        epoch, _, since = headers.get('last-event-id', '').rpartition('-')
+        query = parse_qs(url.query)
+        if 'since' in query:
+            since = query['since'][0]
+            epoch = query.get('epoch', [''])[0]
+        try:
+            since = int(since) if since else self.controller.get_inactive_snapshot().generation
+        except ValueError:
+            await self._respond(writer, '400 Bad Request')
+            return None
+        return since, epoch or None
+
+    async def _respond(self, writer, status):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode())
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _stream(self, writer, since, epoch):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n'
+                     + f'retry: {RETRY}\n\n'.encode())
+        pending = asyncio.Event()
+        pending.set()
+        self.subscribers.add(pending)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(pending.wait(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b': keepalive\n\n')
+                else:
+                    pending.clear()
+                    generation, event = self._delta(since, epoch)
+                    if event is not None:
+                        writer.write(event)
+                    since, epoch = generation, None
+                await asyncio.wait_for(writer.drain(), self.write_timeout)
+        finally:
+            self.subscribers.discard(pending)
+
+    def _delta(self, since, epoch):
+        # (generation, encoded event or None) for a subscriber at generation
+        # since; subscribers at the same generation share one encoding
+        if (since, epoch) not in self.deltas:
+            changes = self.controller.get_changes(since, epoch)
+            generation = changes['generation']
+            event = None
+            if changes['resync'] or generation != since:
+                name = 'resync' if changes['resync'] else 'changes'
+                event = (f'id: {changes["epoch"]}-{generation}\nevent: {name}\n'
+                         f'data: {json.dumps(changes)}\n\n').encode()
+            self.deltas[since, epoch] = generation, event
+        return self.deltas[since, epoch]
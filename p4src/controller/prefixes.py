@@ -0,0 +1,174 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+import ipaddress
+from bisect import bisect_left, insort
+import numpy as np
+
+
+class PrefixMapping:
+    # Maps global_table indices to monitored /32 addresses and back with
+    # arithmetic over one (base_idx, network, length) row per monitored
+    # block, instead of materializing one object per address.
+    def __init__(self):
+        self.blocks = []         # (base_idx, network, length), sorted by base_idx
+        self._bases = []
+        self._by_network = []    # (network, base_idx, length), sorted by network
+        self._networks = []
+        self._dark_bases = {}    # base_idx -> dark_base_idx
+        self._arrays = None
+        self._layout = None
+
+    def add(self, prefix, base_idx, dark_base_idx=0):
+        net = ipaddress.IPv4Network(prefix)
+        block = (base_idx, int(net.network_address), net.prefixlen)
+        insort(self.blocks, block)
+        insort(self._by_network, (block[1], base_idx, block[2]))
+        self._dark_bases[base_idx] = dark_base_idx
+        self._reindex()
+        return block
+
+    def remove(self, prefix):
+        # drop a monitored block; returns its (base_idx, dark_base_idx)
+        net = ipaddress.IPv4Network(prefix)
+        network = int(net.network_address)
+        pos = bisect_left(self._networks, network)
+        if pos == len(self._by_network) or self._by_network[pos][::2] != (network, net.prefixlen):
+            raise KeyError(f'{net} is not monitored')
+        _, base_idx, length = self._by_network.pop(pos)
+        self.blocks.remove((base_idx, network, length))
+        dark_base_idx = self._dark_bases.pop(base_idx)
+        self._reindex()
+        return base_idx, dark_base_idx
+
+    def prefixes(self):
+        # monitored prefix -> (base_idx, dark_base_idx)
+        return {format_address(network, length): (base_idx, self._dark_bases[base_idx])
+                for base_idx, network, length in self.blocks}
+
+    def _reindex(self):
+        self._bases = [b[0] for b in self.blocks]
+        self._networks = [b[0] for b in self._by_network]
+        self._arrays = None
+        self._layout = None
+
+    def __len__(self):
+        # extent of the index space used by the blocks
+        if not self.blocks:
+            return 0
+        base_idx, _, length = self.blocks[-1]
+        return base_idx + 2**(32 - length)
+
+    def addresses(self, indices):
+        # vectorized index -> address for indices known to be mapped
+        bases, networks, _, _ = self._block_arrays()
+        indices = np.asarray(indices, dtype=np.int64)
+        pos = np.searchsorted(bases, indices, side='right') - 1
+        return (networks[pos] + (indices - bases[pos])).astype(np.uint32)
+
+    def mapped(self, indices):
+        # vectorized: which indices fall inside a monitored block
+        bases, _, _, sizes = self._block_arrays()
+        indices = np.asarray(indices, dtype=np.int64)
+        if not len(bases):
+            return np.zeros(len(indices), dtype=bool)
+        pos = np.searchsorted(bases, indices, side='right') - 1
+        inside = indices - bases[pos] < sizes[pos]
+        return (pos >= 0) & inside
+
+    def dark_indices(self, indices):
+        # vectorized index -> dark_meter index, the same arithmetic as the
+        # data plane: dark_base_idx + (offset >> 8), one meter per /24
+        bases, _, dark_bases, _ = self._block_arrays()
+        indices = np.asarray(indices, dtype=np.int64)
+        pos = np.searchsorted(bases, indices, side='right') - 1
+        return dark_bases[pos] + ((indices - bases[pos]) >> 8)
+
+    def layout(self):
+        # (networks, base_idxs, sizes) arrays of the blocks sorted by network,
+        # rebuilt only when the blocks change; never modified once returned
+        if self._layout is None:
+            self._layout = (np.array([b[0] for b in self._by_network], dtype=np.int64),
+                            np.array([b[1] for b in self._by_network], dtype=np.int64),
+                            np.array([2**(32 - b[2]) for b in self._by_network], dtype=np.int64))
+        return self._layout
+
+    def _block_arrays(self):
+        if self._arrays is None:
+            self._arrays = (np.array([b[0] for b in self.blocks], dtype=np.int64),
+                            np.array([b[1] for b in self.blocks], dtype=np.int64),
+                            np.array([self._dark_bases[b[0]] for b in self.blocks], dtype=np.int64),
+                            np.array([2**(32 - b[2]) for b in self.blocks], dtype=np.int64))
+        return self._arrays
+
+
+def overlapping(layout, low, high):
+    # [first, last) positions in a layout() of the blocks that overlap the
+    # addresses [low, high)
+    networks, _, sizes = layout
+    first = int(np.searchsorted(networks + sizes, low, side='right'))
+    last = int(np.searchsorted(networks, high, side='left'))
+    return first, max(first, last)
+
+
+def cidr_cover(runs):
+    # minimal CIDR cover of [start, end) address runs, merging runs that
+    # touch; gives the same prefixes as aggregate() over every address
+    prefixes = []
+    low = high = None
+    for start, end in sorted(runs):
+        if high is not None and start <= high:
+            high = max(high, end)
+            continue
+        if high is not None:
+            _split_run(low, high, prefixes)
+        low, high = start, end
+    if high is not None:
+        _split_run(low, high, prefixes)
+    return prefixes
+
+
+def _split_run(start, end, prefixes):
+    while start < end:
+        # largest aligned block starting at start that fits in the run
+        size = start & -start if start else 2**32
+        while size > end - start:
+            size >>= 1
+        prefixes.append(format_address(start, 33 - size.bit_length()))
+        start += size
+
+
+def format_address(address, length=None):
+    address = str(ipaddress.IPv4Address(int(address)))
+    return address if length is None else f'{address}/{length}'
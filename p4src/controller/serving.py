@@ -0,0 +1,77 @@
+# This software is Copyright (c) 2024 Georgia Tech Research Corporation. All
+# Rights Reserved. Permission to copy, modify, and distribute this software and
+# its documentation for academic research and education purposes, without fee,
+# and without a written agreement is hereby granted, provided that the above
+# copyright notice, this paragraph and the following three paragraphs appear in
+# all copies. Permission to make use of this software for other than academic
+# research and education purposes may be obtained by contacting:
+#
+#  Office of Technology Licensing
+#  Georgia Institute of Technology
+#  926 Dalney Street, NW
+#  Atlanta, GA 30318
+#  404.385.8066
+#  techlicensing@gtrc.gatech.edu
+#
+# This software program and documentation are copyrighted by Georgia Tech
+# Research Corporation (GTRC). The software program and documentation are 
+# supplied "as is", without any accompanying services from GTRC. GTRC does
+# not warrant that the operation of the program will be uninterrupted or
+# error-free. The end-user understands that the program was developed for
+# research purposes and is advised not to rely exclusively on the program for
+# any reason.
+#
+# IN NO EVENT SHALL GEORGIA TECH RESEARCH CORPORATION BE LIABLE TO ANY PARTY FOR
+# DIRECT, INDIRECT, SPECIAL, INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING
+# LOST PROFITS, ARISING OUT OF THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION,
+# EVEN IF GEORGIA TECH RESEARCH CORPORATION HAS BEEN ADVISED OF THE POSSIBILITY
+# OF SUCH DAMAGE. GEORGIA TECH RESEARCH CORPORATION SPECIFICALLY DISCLAIMS ANY
+# WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE SOFTWARE PROVIDED
+# HEREUNDER IS ON AN "AS IS" BASIS, AND  GEORGIA TECH RESEARCH CORPORATION HAS
+# NO OBLIGATIONS TO PROVIDE MAINTENANCE, SUPPORT, UPDATES, ENHANCEMENTS, OR
+# MODIFICATIONS.
+
+
+
+import json
+import logging
+import signal
+
+from waitress.server import create_server
+
+
+def serve(app, host, port, workers, connection_limit, timeout, on_shutdown):
+    # Serve app on a fixed pool of worker threads until SIGTERM or SIGINT.
+    # At most connection_limit connections are open at once (the rest wait
+    # in the listen backlog), and kept-alive or stalled connections are
+    # closed after timeout idle seconds. On shutdown the requests in flight
+    # are finished before on_shutdown is called.
+    server = create_server(app, host=host, port=port, threads=workers,
+                           connection_limit=connection_limit, channel_timeout=timeout)
+
+    def stop(signum, frame):
+        logging.info(f'Received signal {signum}, shutting down')
+        # ends the accept loop; waitress then waits for its workers
+        raise SystemExit
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logging.info(f'Serving on {host}:{port} with {workers} workers')
+    try:
+        server.run()
+    finally:
+        server.close()
+        on_shutdown()
+
+
+def stream_json(key, items, batch=4096, **fields):
+    # {"<key>": [items...], <fields>} as a body generator, so that long lists
+    # go out in pieces instead of one json.dumps of the whole answer
+    yield f'{{{json.dumps(key)}: ['
+    for pos in range(0, len(items), batch):
+        yield (', ' if pos else '') + ', '.join(json.dumps(item) for item in items[pos:pos + batch])
+    yield ']'
+    for name, value in fields.items():
+        yield f', {json.dumps(name)}: {json.dumps(value)}'
+    yield '}'